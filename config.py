@@ -61,8 +61,21 @@ class Config(object):
         "default_image_path": "",
 
         "path_to_makeobj": "",
+        "makeobj_timeout": 300,
+        "makeobj_group": "project",
         "write_dat": True,
 
+        "cut_executor": "serial",
+        "cut_workers": 0,
+        "image_cache_size": 268435456,
+        "tile_cache_directory": "",
+        "tile_cache_size": 1073741824,
+        "export_dedup": False,
+        "export_elide_empty": False,
+        "export_layout": "square",
+        "export_max_width": 0,
+        "export_max_pixels": 0,
+
         "default_language": "English",
     }
     internals = {
@@ -72,6 +85,9 @@ class Config(object):
         "choicelist_views":  [1, 2, 4],
         "choicelist_dims":   [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16],
         "choicelist_dims_z": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16],
+        "choicelist_executors": ["serial", "thread", "process"],
+        "choicelist_layouts": ["square", "tight"],
+        "choicelist_makeobj_groups": ["project", "pakfile", "directory"],
     }
 
     def __init__(self):
@@ -2,14 +2,87 @@
 #
 # TileCutter Project Module
 
-import logging, os, sys
-import wx
-import config
+import hashlib, logging, os, re, sys
+import concurrent.futures
+from contextlib import contextmanager
+import numpy as np
+try:
+    import wx
+except ImportError:
+    # Without wx only the array representation of images is available (e.g. in CLI mode)
+    wx = None
+import config, tccache, tcpng, tcstats
 from environment import getenvvar
 from tc import Paths
 config = config.Config()
 paths = Paths()
 
+def image_slot_path(d, s, f, l, name):
+    """Return the property path of a property of an image slot, as passed to on_change"""
+    return "images[%s][%s][%s][%s].%s" % (d, s, f, l, name)
+
+def path_parts(path):
+    return re.findall(r"[^.\[\]]+", path)
+
+def path_matches(pattern, path):
+    """Return True if a change to the property at path changes the property pattern, or anything within it
+    (or path is within pattern). * in pattern matches any index, e.g. "images[*][*][*][*].offset" """
+    for p, q in zip(path_parts(pattern), path_parts(path)):
+        if p != "*" and p != q:
+            return False
+    return True
+
+def load_array(abspath):
+    """Return an RGBA array of the image file at abspath"""
+    if (paths.is_input_file(abspath) and os.path.exists(abspath)):
+        return tccache.images.get(abspath, "array", read_array)
+    else:
+        # Same as the blank wxImage used when the path isn't valid, a single black pixel
+        return np.array([[[0, 0, 0, 255]]], np.uint8)
+
+def read_array(abspath):
+    """Decode the image file at abspath as a read-only RGBA array, so it can be shared through the cache"""
+    with tcstats.stage("load") as measure:
+        array = tcpng.read(abspath)
+        array.setflags(write=False)
+        measure.bytes = array.nbytes
+        measure.count = 1
+    return array
+
+def array_to_image(array):
+    """Return a new wxImage with the contents of an RGBA array"""
+    height, width = array.shape[:2]
+    return wx.Image(width, height, array[:, :, :3].tobytes(), array[:, :, 3].tobytes())
+
+def array_to_bitmap(array):
+    """Return a new wxBitmap with the contents of an RGBA array"""
+    height, width = array.shape[:2]
+    return wx.Bitmap.FromBufferRGBA(width, height, np.ascontiguousarray(array))
+
+def hash_file(abspath):
+    """Return a hash of the contents of the file at abspath"""
+    f = open(abspath, "rb")
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+def cut_file(cutting_function, abspath, dims, offset, p, transparency):
+    """Load the image file at abspath as an array and call cutting_function on it
+    Used by the process executor, so that images are loaded within the worker process"""
+    return cutting_function(load_array(abspath), dims, offset, p, transparency)
+
+class Slot(object):
+    """Images of one image slot of a project (project.internals["images"][d][s][f][l])
+    source is the RGBA array of the slot's file, the same array for every slot using that file (see Project.source_image)
+    cut is the (x, y, z, p, p, 4) array of its cut images, and fingerprint the inputs it was cut from (see cut_fingerprint)
+    wx images of a slot aren't stored, they're made from source when needed (see Project.get_bitmap)"""
+    __slots__ = ["source", "cut", "fingerprint"]
+
+    def __init__(self):
+        self.source = None
+        self.cut = None
+        self.fingerprint = None
+
 # Old project needs to be kept to ensure compatibility with old .tcp files using pickle
 # handler in load to check kind of file and use the correct module type
 # but it'll always convert it into the new format for use by the program
@@ -37,7 +110,11 @@ class Project(object):
 
         # internals is used to store things which shouldn't be saved, e.g. image data, save path etc.
         self.internals = {
-            "images": self.init_image_array(),
+            "images": self.init_slot_array(),
+            # Decoded images of each source file, shared by every slot using that file (see source_image)
+            "sources": {},
+            # Last bitmap made by get_bitmap, and the source array it was made from
+            "bitmap": (None, None),
             "activeimage": {
                 "direction": 0,
                 "season": 0,
@@ -48,7 +125,14 @@ class Project(object):
                 "saved": saved,
                 "save_location": "",
             },
-            "hash": 0,
+            # Number of changes made to props, and the number there had been when the project was last saved
+            "modifications": 0,
+            "saved_modifications": 0,
+            # Nesting depth of batch contexts, and the property paths changed within them
+            "batch_depth": 0,
+            "batch_paths": [],
+            # Number of image slots cut and skipped by the last call to cut_images
+            "cut_counts": {"cut": 0, "cached": 0, "skipped": 0},
         }
 
         if self.save_location(save_location, validate=True):
@@ -130,7 +214,7 @@ class Project(object):
             # Loading project from potential props dict specified (needs validation)
             self.props = self.load_dict(load, self.validators, self.defaults)
 
-        # Set initial hash value to indicate that the project is unchanged (either having just been loaded in, or being brand new)
+        # Mark the project as unchanged (either having just been loaded in, or being brand new)
         self.update_hash()
 
     def __getitem__(self, key):
@@ -195,6 +279,10 @@ class Project(object):
             viewarray.append(seasonarray)
         return viewarray
 
+    def init_slot_array(self):
+        """Init an array of empty Slots, the same shape as the default image array"""
+        return [[[[Slot() for layer in range(2)] for frame in range(1)] for season in range(5)] for view in range(4)]
+
     def image_array(self, set=None, validate=False):
         """Get or set the entire image array"""
         # input should be a list containing 4 items
@@ -247,9 +335,9 @@ class Project(object):
             # If nothing is invalid with the image_array set it and return True
             if not validate:
                 self.props["images"] = fresh_image_array
-                # Need to reload all images so they reflect any changes
-                self.reload_all_images()
-                self.on_change()
+                # Images are loaded again from their new paths when next needed
+                self.unload_all_images()
+                self.on_change("images")
 
             return True
         else:
@@ -287,36 +375,60 @@ class Project(object):
         else:
             return os.path.join(path, "new_project.tcp") 
 
-    def on_change(self):
+    def on_change(self, path=None, modified=True):
         # When something in the project has changed, notify containing app to
         # allow for updating of UI
+        # path is the property changed (e.g. "dims.x", see image_slot_path), None if anything could have
+        # modified is False for changes to things which aren't saved (e.g. the active image)
+        if modified:
+            self.internals["modifications"] += 1
+        if self.internals["batch_depth"] > 0:
+            # Sent once the batch is done
+            if path not in self.internals["batch_paths"]:
+                self.internals["batch_paths"].append(path)
+        else:
+            self.notify([path])
+
+    def notify(self, changed):
+        """Send the list of property paths changed to the containing app"""
+        if None in changed:
+            changed = None
         if self.parent is not None:
-            logging.debug("project: on_change - Root on_change triggered, sending message to App")
-            self.parent.project_has_changed()
+            logging.debug("project: notify - Root on_change triggered, sending message to App, changed: %s" % changed)
+            self.parent.project_has_changed(changed)
         else:
-            logging.warn("project: on_change - Root on_change triggered but no parent specified, doing nothing")
+            logging.warn("project: notify - Root on_change triggered but no parent specified, doing nothing")
+
+    @contextmanager
+    def batch(self):
+        """Merge the change notifications of everything changed within this context into one, sent at its end
+        Batches can be nested, notifications are sent when the outermost one ends"""
+        self.internals["batch_depth"] += 1
+        try:
+            yield self
+        finally:
+            self.internals["batch_depth"] -= 1
+            if self.internals["batch_depth"] == 0 and self.internals["batch_paths"]:
+                changed = self.internals["batch_paths"]
+                self.internals["batch_paths"] = []
+                self.notify(changed)
 
     #################################################################
     # Functions related to checking whether the project has changed #
     #################################################################
     def has_changed(self):
-        """An indication of whether this project has been changed since the last time it was saved"""
-        current = self.hash_props()
-
-        if current == self.internals["hash"]:
+        """An indication of whether this project has been changed since the last time it was saved
+        Every change to props counts, even one which sets a value back to what it was when saved"""
+        if self.internals["modifications"] == self.internals["saved_modifications"]:
             logging.debug("project: has_changed - Check Project for changes - Project Unchanged")
             return False
         else:
             logging.debug("project: has_changed - Check Project for changes - Project Changed")
             return True
 
-    def hash_props(self):
-        """Return a hash of the representation of the properties dict for use in comparisons"""
-        return hash(repr(self.props))
-
     def update_hash(self):
-        """Set intenals hash to the current hash value"""
-        self.internals["hash"] = self.hash_props()
+        """Mark the project as unchanged, e.g. once saved"""
+        self.internals["saved_modifications"] = self.internals["modifications"]
         return True
 
     #################################################
@@ -329,7 +441,7 @@ class Project(object):
                 if not validate:
                     self.props["dat"]["dat_lump"] = set
                     logging.info("project: dat_lump - properties set to %s" % self.props["dat"]["dat_lump"])
-                    self.on_change()
+                    self.on_change("dat.dat_lump")
                 return True
             else:
                 logging.warn("project: dat_lump - type of value (%s) outside of acceptable range" % str(set))
@@ -356,9 +468,10 @@ class Project(object):
                 if not validate:
                     self.props["images"][d][s][f][l]["path"] = set
                     logging.debug("project: image_path - for image d:%s, s:%s, f:%s, l:%s set to %s" % (d, s, f, l, self.props["images"][d][s][f][l]["path"]))
-                    # This will either load the image (if the path exists) or set a default image if it doesn't
-                    self.reload_image(d, s, f, l)
-                    self.on_change()
+                    # The image is loaded from the new path when next needed (or a default image used if it doesn't exist)
+                    self.unload_image(d, s, f, l)
+                    self.prune_sources()
+                    self.on_change(image_slot_path(d, s, f, l, "path"))
 
                 return True
             else:
@@ -368,9 +481,8 @@ class Project(object):
             return self.props["images"][d][s][f][l]["path"]
 
     def get_image(self, d, s, f, l):
-        """Return a wxImage representation of the specified image"""
-        self.reload_image(d, s, f, l)
-        return self.internals["images"][d][s][f][l]["imagedata"]
+        """Return a wxImage representation of the specified image, a new image made from its array"""
+        return array_to_image(self.get_array(d, s, f, l))
 
     def get_active_image(self):
         """Return a wxImage representation of the active image"""
@@ -380,9 +492,12 @@ class Project(object):
                               self.internals["activeimage"]["layer"])
 
     def get_bitmap(self, d, s, f, l):
-        """Return a wxBitmap representation of the specified image"""
-        self.reload_image(d, s, f, l)
-        return self.internals["images"][d][s][f][l]["bitmapdata"]
+        """Return a wxBitmap representation of the specified image, made from its array
+        Only the last bitmap made is kept, so redrawing the same image doesn't make it again"""
+        source = self.get_array(d, s, f, l)
+        if self.internals["bitmap"][0] is not source:
+            self.internals["bitmap"] = (source, array_to_bitmap(source))
+        return self.internals["bitmap"][1]
 
     def get_active_bitmap(self):
         """Return a wxBitmap representation of the active image"""
@@ -391,43 +506,179 @@ class Project(object):
                                self.internals["activeimage"]["frame"], 
                                self.internals["activeimage"]["layer"])
 
+    def get_array(self, d, s, f, l):
+        """Return an RGBA array representation of the specified image"""
+        self.reload_array(d, s, f, l)
+        return self.internals["images"][d][s][f][l].source
+
     def set_all_images(self, path):
         """Set the path for all images to the same path"""
-        for d in range(len(self.props["images"])):
-            for s in range(len(self.props["images"][d])):
-                for f in range(len(self.props["images"][d][s])):
-                    for l in range(len(self.props["images"][d][s][f])):
-                        self.props["images"][d][s][f][l]["path"] = path
-                        self.reload_image(d, s, f, l)
-        self.on_change()
+        with self.batch():
+            for d in range(len(self.props["images"])):
+                for s in range(len(self.props["images"][d])):
+                    for f in range(len(self.props["images"][d][s])):
+                        for l in range(len(self.props["images"][d][s][f])):
+                            self.image_path(d, s, f, l, path)
 
     def get_cut_image(self, d, s, f, l, x, y, z):
-        """Return cut image fragments based on full coordinate lookup in wxBitmap format, used by output writer"""
-        return self.internals["images"][d][s][f][l]["cutimageset"][x][y][z]
+        """Return cut image fragments based on full coordinate lookup as an RGBA array, used by output writer"""
+        return self.internals["images"][d][s][f][l].cut[x, y, z]
+
+    def cut_images(self, cutting_function, image_format="bitmap", executor=None, workers=None, incremental=False):
+        """Produce cut imagesets for all images in this project, returns counts of slots cut, read from the tile cache
+        (see tccache.TileCache) and skipped
+        image_format is "bitmap" or "array", the type of source image the cutting function takes
+        executor is "serial", "thread" or "process", workers is the maximum number of threads or
+        processes (0 for one per CPU), both default to the config settings
+        If incremental is True, slots whose inputs haven't changed since they were last cut are skipped"""
+        if executor is None:
+            executor = config.cut_executor
+        if workers is None:
+            workers = config.cut_workers
+        if executor not in config.choicelist_executors:
+            logging.warn("project: cut_images - unknown executor: %s, cutting serially" % executor)
+            executor = "serial"
+        if executor != "serial" and image_format != "array":
+            # wx objects can't be shared between threads or processes
+            logging.warn("project: cut_images - %s images can only be cut serially" % image_format)
+            executor = "serial"
+
+        # Every image slot is cut independently, results are stored in the same order whichever executor is used
+        # Slots the project's settings disable aren't output, so aren't cut (or loaded) at all
+        slots = self.enabled_slots()
+
+        fingerprints = [self.cut_fingerprint(cutting_function, image_format, *slot) for slot in slots]
+
+        # Slots with the same fingerprint (e.g. seasons using the same image) are only cut once
+        # When incremental, slots which still have the cut imageset for their fingerprint aren't cut at all
+        cut = {}
+        if incremental:
+            for (d, s, f, l), fingerprint in zip(slots, fingerprints):
+                if self.internals["images"][d][s][f][l].fingerprint == fingerprint:
+                    cut[fingerprint] = self.internals["images"][d][s][f][l].cut
+        to_cut = []
+        queued = set(cut)
+        for slot, fingerprint in zip(slots, fingerprints):
+            if fingerprint not in queued:
+                to_cut.append((slot, fingerprint))
+                queued.add(fingerprint)
+
+        # Then the tile cache, which has cut images from earlier runs
+        cached = 0
+        cache_keys = {}
+        if tccache.tiles.enabled():
+            misses = []
+            for slot, fingerprint in to_cut:
+                # Files which don't exist have no content to key on
+                if fingerprint[0] is None:
+                    misses.append((slot, fingerprint))
+                    continue
+                cache_keys[fingerprint] = tccache.tiles.key(fingerprint)
+                cutimageset = tccache.tiles.get(cache_keys[fingerprint])
+                if cutimageset is None:
+                    misses.append((slot, fingerprint))
+                else:
+                    cut[fingerprint] = cutimageset
+                    cached += 1
+            to_cut = misses
+        to_cut_slots = [k[0] for k in to_cut]
+
+        logging.info("project: cut_images - cutting %s of %s images (%s from tile cache), executor: %s, workers: %s" % (len(to_cut), len(slots), cached, executor, workers))
+
+        with tcstats.stage("cut") as measure:
+            if executor == "serial":
+                cutimagesets = [self.cut_image(cutting_function, image_format, *slot) for slot in to_cut_slots]
+            elif executor == "thread":
+                with concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+                    cutimagesets = list(pool.map(lambda slot: self.cut_image(cutting_function, image_format, *slot), to_cut_slots))
+            elif to_cut:
+                # Worker processes load the images themselves, only paths and cut arrays are passed between processes
+                # Their image load and mask build times are only included in the cut time
+                cut_args = [(cutting_function, self.image_abspath(*slot)) + self.cut_args(*slot) for slot in to_cut_slots]
+                with concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+                    cutimagesets = list(pool.map(cut_file, *zip(*cut_args)))
+            else:
+                cutimagesets = []
+            measure.bytes = sum([c.nbytes for c in cutimagesets])
+            measure.count = len(cutimagesets)
+
+        for (slot, fingerprint), cutimageset in zip(to_cut, cutimagesets):
+            cut[fingerprint] = cutimageset
+            if fingerprint in cache_keys:
+                tccache.tiles.put(cache_keys[fingerprint], cutimageset)
+        if cache_keys and to_cut:
+            tccache.tiles.trim_if_needed()
+
+        for (d, s, f, l), fingerprint in zip(slots, fingerprints):
+            self.internals["images"][d][s][f][l].cut = cut[fingerprint]
+            self.internals["images"][d][s][f][l].fingerprint = fingerprint
+
+        self.internals["cut_counts"] = {"cut": len(to_cut), "cached": cached, "skipped": len(slots) - len(to_cut) - cached}
+        logging.info("project: cut_images - cut: %(cut)s, from tile cache: %(cached)s, skipped: %(skipped)s" % self.internals["cut_counts"])
+        return self.internals["cut_counts"]
+
+    def season_images(self):
+        """Return the image season index used for each season output, as enabled by the seasons settings
+        Either summer, plus snow if enabled, or summer, autumn, winter, spring (plus snow), where disabled seasons
+        use the summer image"""
+        autumn = self.seasons(season="autumn")
+        winter = self.seasons(season="winter")
+        spring = self.seasons(season="spring")
+        if autumn == 1 or winter == 1 or spring == 1:
+            seasons_img = [0, 2 * autumn, 3 * winter, 4 * spring, 1]
+            return seasons_img[:4 + self.seasons(season="snow")]
+        else:
+            return [0, 1][:1 + self.seasons(season="snow")]
 
-    def cut_images(self, cutting_function):
-        """Produce cut imagesets for all images in this project"""
-        # Can make this work conditionally based on which images are enabled later
-        for d in range(len(self.props["images"])):
+    def enabled_slots(self):
+        """Return a list of (direction, season, frame, layer) of every image slot used by the project's settings"""
+        seasons = set(self.season_images())
+        slots = []
+        for d in range(self.directions()):
             for s in range(len(self.props["images"][d])):
-                for f in range(len(self.props["images"][d][s])):
-                    for l in range(len(self.props["images"][d][s][f])):
-                        # Reload the image to obtain most recent version
-                        self.reload_image(d, s, f, l)
-                        # Call cutting function on image and store data on the internals array
-                        # Cutting function by convention takes args: wxbitmap, dims(x,y,z,direction), offset, paksize
-                        self.internals["images"][d][s][f][l]["cutimageset"] = cutting_function(
-                            self.internals["images"][d][s][f][l]["bitmapdata"],
-                            (
-                                self.props["dims"]["x"],
-                                self.props["dims"]["y"],
-                                self.props["dims"]["z"],
-                                d
-                            ),
-                            self.props["images"][d][s][f][l]["offset"],
-                            self.props["dims"]["paksize"],
-                            self.props["transparency"]
-                        )
+                if s not in seasons:
+                    continue
+                for f in range(min(self.frames(), len(self.props["images"][d][s]))):
+                    for l in range(self.frontimage() + 1):
+                        slots.append((d, s, f, l))
+        return slots
+
+    def cut_fingerprint(self, cutting_function, image_format, d, s, f, l):
+        """Return a value which changes whenever the cut imageset for the specified image would change
+        Made up of the source file's content hash, the cutting function and its other arguments"""
+        abspath = self.image_abspath(d, s, f, l)
+        if (paths.is_input_file(abspath) and os.path.exists(abspath)):
+            content = tccache.images.get(abspath, "hash", hash_file)
+        else:
+            # Invalid paths all give the same blank image
+            content = None
+        dims, offset, p, transparency = self.cut_args(d, s, f, l)
+        return (content, cutting_function.__module__, cutting_function.__name__, image_format,
+                dims, tuple(offset), p, transparency)
+
+    def cut_args(self, d, s, f, l):
+        """Return the arguments after the source image for a call to a cutting function for the specified image
+        Cutting function by convention takes args: source image, dims(x,y,z,direction), offset, paksize, transparency"""
+        return (
+            (
+                self.props["dims"]["x"],
+                self.props["dims"]["y"],
+                self.props["dims"]["z"],
+                d
+            ),
+            self.props["images"][d][s][f][l]["offset"],
+            self.props["dims"]["paksize"],
+            self.props["transparency"]
+        )
+
+    def cut_image(self, cutting_function, image_format, d, s, f, l):
+        """Call cutting function on the specified image, returns the cut imageset"""
+        # Reload the image to obtain most recent version
+        if image_format == "array":
+            source = self.get_array(d, s, f, l)
+        else:
+            source = self.get_bitmap(d, s, f, l)
+        return cutting_function(source, *self.cut_args(d, s, f, l))
 
     def reload_all_images(self):
         """Reloads all images"""
@@ -436,25 +687,87 @@ class Project(object):
                 for f in range(len(self.props["images"][d][s])):
                     for l in range(len(self.props["images"][d][s][f])):
                         self.reload_image(d, s, f, l)
-
-    def reload_active_image(self):
-        """Refresh the active image"""
+        self.prune_sources()
+
+    def unload_image(self, d, s, f, l):
+        """Drop the decoded image of the specified image, which is loaded again when next needed (e.g. by get_bitmap)"""
+        self.internals["images"][d][s][f][l].source = None
+
+    def unload_all_images(self):
+        """Drop the decoded images of all images"""
+        for d in range(len(self.internals["images"])):
+            for s in range(len(self.internals["images"][d])):
+                for f in range(len(self.internals["images"][d][s])):
+                    for l in range(len(self.internals["images"][d][s][f])):
+                        self.unload_image(d, s, f, l)
+        self.prune_sources()
+
+    def prefetch(self, d=None):
+        """Load the images of the enabled slots of view d (the active view by default), ahead of them being shown
+        Images are otherwise only loaded when needed, so opening a project only loads the image shown"""
+        if d is None:
+            d = self.internals["activeimage"]["direction"]
+        for slot in self.enabled_slots():
+            if slot[0] == d:
+                self.reload_image(*slot)
+
+    def reload_active_image(self, invalidate=False):
+        """Refresh the active image, if invalidate is True the image is always read from its file again"""
         return self.reload_image(self.internals["activeimage"]["direction"], 
                                  self.internals["activeimage"]["season"], 
                                  self.internals["activeimage"]["frame"], 
-                                 self.internals["activeimage"]["layer"])
-
-    def reload_image(self, d, s, f, l):
-        """Refresh the specified image, inputs are: direction, season, frame, layer"""
-        # If path is valid, use it, otherwise use a blank image/image with error message
-        abspath = paths.join_paths(self.internals["files"]["save_location"], self.props["images"][d][s][f][l]["path"])
-        # If path is valid, load file
-        self.internals["images"][d][s][f][l]["imagedata"] = wx.Image(1, 1)
-        if (paths.is_input_file(abspath) and os.path.exists(abspath)):
-            self.internals["images"][d][s][f][l]["imagedata"].LoadFile(abspath, wx.BITMAP_TYPE_ANY)
-        # If path isn't valid, just leave it as an empty image (or could display an error image?)
-
-        self.internals["images"][d][s][f][l]["bitmapdata"] = wx.Bitmap(self.internals["images"][d][s][f][l]["imagedata"])
+                                 self.internals["activeimage"]["layer"],
+                                 invalidate)
+
+    def reload_image(self, d, s, f, l, invalidate=False):
+        """Refresh the specified image, inputs are: direction, season, frame, layer
+        Decoded images are shared through source_image, if invalidate is True the image is always read from its file again"""
+        abspath = self.image_abspath(d, s, f, l)
+        if invalidate:
+            tccache.images.invalidate(abspath)
+            self.internals["sources"].pop(abspath, None)
+            self.internals["bitmap"] = (None, None)
+        # Without wx there is nothing to display, arrays are loaded when images are cut
+        if wx is None:
+            return
+        self.reload_array(d, s, f, l)
+
+    def reload_array(self, d, s, f, l):
+        """Refresh the array representation of the specified image, inputs are: direction, season, frame, layer
+        If path isn't valid the image is left blank (see load_array)"""
+        self.internals["images"][d][s][f][l].source = self.source_image(self.image_abspath(d, s, f, l), "array", load_array)
+
+    def source_image(self, abspath, kind, load):
+        """Return the decoded image of the specified kind (e.g. "array") of the file at abspath
+        Decoded once, by calling load(abspath), then shared by every slot using the file until the file changes
+        Unlike tccache this holds on to images larger than the cache, shared images must not be modified"""
+        try:
+            stat = os.stat(abspath)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        sources = self.internals["sources"]
+        if abspath not in sources or sources[abspath]["version"] != version:
+            sources[abspath] = {"version": version}
+        if kind not in sources[abspath]:
+            sources[abspath][kind] = load(abspath)
+        return sources[abspath][kind]
+
+    def prune_sources(self):
+        """Drop decoded images of files no slot uses any more"""
+        used = set([self.image_abspath(d, s, f, l)
+                    for d in range(len(self.props["images"]))
+                    for s in range(len(self.props["images"][d]))
+                    for f in range(len(self.props["images"][d][s]))
+                    for l in range(len(self.props["images"][d][s][f]))])
+        for abspath in [k for k in self.internals["sources"] if k not in used]:
+            del self.internals["sources"][abspath]
+            # The last bitmap made may have been of this file
+            self.internals["bitmap"] = (None, None)
+
+    def image_abspath(self, d, s, f, l):
+        """Return the absolute path of the specified image"""
+        return paths.join_paths(self.internals["files"]["save_location"], self.props["images"][d][s][f][l]["path"])
 
     def active_x_offset(self, set=None, validate=False):
         """Get or set the active image's x offset"""
@@ -472,7 +785,7 @@ class Project(object):
                 if not validate:
                     self.props["images"][d][s][f][l]["offset"][0] = set
                     logging.debug("project: x_offset - X Offset for image d:%s, s:%s, f:%s, l:%s set to %i" % (d, s, f, l, self.props["images"][d][s][f][l]["offset"][0]))
-                    self.on_change()
+                    self.on_change(image_slot_path(d, s, f, l, "offset"))
 
                 return True
             else:
@@ -497,7 +810,7 @@ class Project(object):
                 if not validate:
                     self.props["images"][d][s][f][l]["offset"][1] = set
                     logging.debug("project: y_offset - Y Offset for image d:%s, s:%s, f:%s, l:%s set to %i" % (d, s, f, l, self.props["images"][d][s][f][l]["offset"][1]))
-                    self.on_change()
+                    self.on_change(image_slot_path(d, s, f, l, "offset"))
 
                 return True
             else:
@@ -523,7 +836,7 @@ class Project(object):
                 if not validate:
                     self.props["images"][d][s][f][l]["offset"] = [set[0], set[1]]
                     logging.debug("project: offset - Offset for image d:%s, s:%s, f:%s, l:%s set to %i" % (d, s, f, l, self.props["images"][d][s][f][l]["offset"][1]))
-                    self.on_change()
+                    self.on_change(image_slot_path(d, s, f, l, "offset"))
 
                 return True
             else:
@@ -542,7 +855,7 @@ class Project(object):
                 if not validate:
                     self.internals["activeimage"]["direction"] = set
                     logging.debug("project: direction - Active image direction set to %i" % self.internals["activeimage"]["direction"])
-                    self.on_change()
+                    self.on_change("activeimage.direction", modified=False)
 
                 return True
             else:
@@ -558,7 +871,7 @@ class Project(object):
                 if not validate:
                     self.internals["activeimage"]["season"] = set
                     logging.debug("project: season - Active image season set to %i" % self.internals["activeimage"]["season"])
-                    self.on_change()
+                    self.on_change("activeimage.season", modified=False)
 
                 return True
             else:
@@ -574,7 +887,7 @@ class Project(object):
                 if not validate:
                     self.internals["activeimage"]["frame"] = set
                     logging.debug("project: frame - Active image frame set to %i" % self.internals["activeimage"]["frame"])
-                    self.on_change()
+                    self.on_change("activeimage.frame", modified=False)
 
                 return True
             else:
@@ -590,7 +903,7 @@ class Project(object):
                 if not validate:
                     self.internals["activeimage"]["layer"] = set
                     logging.debug("project: layer - Active image layer set to %i" % self.internals["activeimage"]["layer"])
-                    self.on_change()
+                    self.on_change("activeimage.layer", modified=False)
 
                 return True
             else:
@@ -626,7 +939,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["x"] = int(set)
                     logging.debug("project: x - set to %i" % self.props["dims"]["x"])
-                    self.on_change()
+                    self.on_change("dims.x")
 
                 return True
             else:
@@ -642,7 +955,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["y"] = int(set)
                     logging.debug("project: y - set to %i" % self.props["dims"]["y"])
-                    self.on_change()
+                    self.on_change("dims.y")
 
                 return True
             else:
@@ -658,7 +971,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["z"] = int(set)
                     logging.debug("project: z - set to %i" % self.props["dims"]["z"])
-                    self.on_change()
+                    self.on_change("dims.z")
 
                 return True
             else:
@@ -673,14 +986,14 @@ class Project(object):
                 if not validate:
                     self.props["transparency"] = True
                     logging.debug("project: transparency - set to %s" % str(self.props["transparency"]))
-                    self.on_change()
+                    self.on_change("transparency")
 
                 return True
             elif set in [False, 0]:
                 if not validate:
                     self.props["transparency"] = False
                     logging.debug("project: transparency - set to %s" % str(self.props["transparency"]))
-                    self.on_change()
+                    self.on_change("transparency")
 
                 return True
             else:
@@ -696,7 +1009,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["paksize"] = int(set)
                     logging.debug("project: paksize - set to %i" % self.props["dims"]["paksize"])
-                    self.on_change()
+                    self.on_change("dims.paksize")
 
                 return True
             else:
@@ -712,14 +1025,14 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["seasons"][season] = 1
                     logging.debug("project: seasons - %s set to %i" % (season, self.props["dims"]["seasons"][season]))
-                    self.on_change()
+                    self.on_change("dims.seasons.%s" % season)
 
                 return True
             elif set in [False, 0]:
                 if not validate:
                     self.props["dims"]["seasons"][season] = 0
                     logging.debug("project: seasons - %s set to %i" % (season, self.props["dims"]["seasons"][season]))
-                    self.on_change()
+                    self.on_change("dims.seasons.%s" % season)
 
                 return True
             else:
@@ -735,14 +1048,14 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["frontimage"] = 1
                     logging.debug("project: frontimage - set to %i" % self.props["dims"]["frontimage"])
-                    self.on_change()
+                    self.on_change("dims.frontimage")
 
                 return True
             elif set in [False, 0]:
                 if not validate:
                     self.props["dims"]["frontimage"] = 0
                     logging.debug("project: frontimage - set to %i" % self.props["dims"]["frontimage"])
-                    self.on_change()
+                    self.on_change("dims.frontimage")
 
                 return True
             else:
@@ -758,7 +1071,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["frames"] = int(set)
                     logging.debug("project: frames - set to %i" % self.props["dims"]["frames"])
-                    self.on_change()
+                    self.on_change("dims.frames")
 
                 return True
             else:
@@ -774,7 +1087,7 @@ class Project(object):
                 if not validate:
                     self.props["dims"]["directions"] = int(set)
                     logging.debug("project: directions - set to %i" % self.props["dims"]["directions"])
-                    self.on_change()
+                    self.on_change("dims.directions")
 
                 return True
             else:
@@ -793,7 +1106,7 @@ class Project(object):
                 if not validate:
                     self.props["files"]["datfile_location"] = str(set)
                     logging.debug("project: datfile_location - set to %s" % self.props["files"]["datfile_location"])
-                    self.on_change()
+                    self.on_change("files.datfile_location")
 
                 return True
             else:
@@ -809,14 +1122,14 @@ class Project(object):
                 if not validate:
                     self.props["files"]["datfile_write"] = True
                     logging.debug("project: datfile_write - set to %s" % self.props["files"]["datfile_write"])
-                    self.on_change()
+                    self.on_change("files.datfile_write")
 
                 return True
             elif set in [False, 0]:
                 if not validate:
                     self.props["files"]["datfile_write"] = False
                     logging.debug("project: datfile_write - set to %s" % self.props["files"]["datfile_write"])
-                    self.on_change()
+                    self.on_change("files.datfile_write")
 
                 return True
             else:
@@ -832,7 +1145,7 @@ class Project(object):
                 if not validate:
                     self.props["files"]["pngfile_location"] = str(set)
                     logging.debug("project: pngfile_location - set to %s" % self.props["files"]["pngfile_location"])
-                    self.on_change()
+                    self.on_change("files.pngfile_location")
 
                 return True
             else:
@@ -848,7 +1161,7 @@ class Project(object):
                 if not validate:
                     self.props["files"]["pakfile_location"] = str(set)
                     logging.debug("project: pakfile_location - set to %s" % self.props["files"]["pakfile_location"])
-                    self.on_change()
+                    self.on_change("files.pakfile_location")
 
                 return True
             else:
@@ -868,12 +1181,12 @@ class Project(object):
             if set in [True, 1]:
                 self.internals["files"]["saved"] = True
                 logging.debug("project: saved - set to %s" % self.internals["files"]["saved"])
-                self.on_change()
+                self.on_change("files.saved", modified=False)
                 return True
             elif set in [False, 0]:
                 self.internals["files"]["saved"] = False
                 logging.debug("project: saved - set to %s" % self.internals["files"]["saved"])
-                self.on_change()
+                self.on_change("files.saved", modified=False)
                 return True
             else:
                 logging.warn("Attempt to set project saved status failed - Value (%s) outside of acceptable range" % str(set))
@@ -887,7 +1200,7 @@ class Project(object):
             if type(set) in [type(""), type("")]:
                 self.internals["files"]["save_location"] = str(set)
                 logging.debug("project: save_location - set to %s" % self.internals["files"]["save_location"])
-                self.on_change()
+                self.on_change("files.save_location", modified=False)
                 return True
             else:
                 logging.warn("project: save_location - Attempt to set project save_location status failed - type of value (%s) outside of acceptable range" % str(set))
@@ -101,6 +101,85 @@ class dat_lump_knownvalues(unittest.TestCase):
             if p.dat_lump(testvalue) == True:
                 self.assertEqual(testvalue, p.dat_lump())
 
+class has_changed(unittest.TestCase):
+    """Test tracking of changes since the project was saved"""
+
+    def test_changes(self):
+        p = project.Project()
+        self.assertFalse(p.has_changed())
+        p.x_offset(0, 0, 0, 0, 5)
+        self.assertTrue(p.has_changed())
+        p.update_hash()
+        self.assertFalse(p.has_changed())
+        p.dat_lump("Obj=building")
+        self.assertTrue(p.has_changed())
+
+    def test_unsaved_values(self):
+        """Changing the active image or save location doesn't change what is saved"""
+        p = project.Project()
+        p.active_image(direction=1)
+        p.active_image(layer=1)
+        p.save_location("test.tcp")
+        p.saved(True)
+        self.assertFalse(p.has_changed())
+
+    def test_validate(self):
+        p = project.Project()
+        p.x(2, validate=True)
+        self.assertFalse(p.has_changed())
+
+class ChangeRecorder(object):
+    """Stand-in for the app, records the property paths of each change notification"""
+
+    def __init__(self):
+        self.notifications = []
+
+    def project_has_changed(self, changed=None):
+        self.notifications.append(changed)
+
+class on_change(unittest.TestCase):
+    """Test change notifications and batching of them"""
+
+    def test_paths(self):
+        recorder = ChangeRecorder()
+        p = project.Project(recorder)
+        recorder.notifications = []
+        p.x(2)
+        p.x_offset(1, 0, 0, 1, 5)
+        p.active_image(direction=1)
+        self.assertEqual(recorder.notifications, [["dims.x"], ["images[1][0][0][1].offset"], ["activeimage.direction"]])
+
+    def test_batch(self):
+        recorder = ChangeRecorder()
+        p = project.Project(recorder)
+        recorder.notifications = []
+        with p.batch():
+            p.x(2)
+            with p.batch():
+                p.y(2)
+                p.x(3)
+            self.assertEqual(recorder.notifications, [])
+        # One notification when the outermost batch ends, each path once
+        self.assertEqual(recorder.notifications, [["dims.x", "dims.y"]])
+
+    def test_set_all_images(self):
+        recorder = ChangeRecorder()
+        p = project.Project(recorder)
+        recorder.notifications = []
+        p.set_all_images("test.png")
+        self.assertEqual(len(recorder.notifications), 1)
+        self.assertEqual(recorder.notifications[0][0], "images[0][0][0][0].path")
+
+    def test_path_matches(self):
+        self.assertTrue(project.path_matches("dims", "dims.x"))
+        self.assertTrue(project.path_matches("dims.x", "dims"))
+        self.assertFalse(project.path_matches("dims.x", "dims.y"))
+        self.assertTrue(project.path_matches("images[*][*][*][*].offset", "images[0][1][0][1].offset"))
+        self.assertFalse(project.path_matches("images[*][*][*][*].offset", "images[0][1][0][1].path"))
+        self.assertFalse(project.path_matches("images[0][*][*][*].offset", "images[1][0][0][0].offset"))
+        # Replacing the whole image array changes every image
+        self.assertTrue(project.path_matches("images[*][*][*][*].offset", "images"))
+
 if __name__ == "__main__":
     app = wx.App()
     unittest.main()
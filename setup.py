@@ -94,7 +94,7 @@ if len(sys.argv) >= 2 and sys.argv[1] == "source":
         print("Copying contents of: %s/" % recdir)
         shutil.copytree(recdir, os.path.join(dist_dir, recdir), ignore=shutil.ignore_patterns(".svn", "tmp*", "*.pyc", "*.py~", "*.tab~"))
 
-    for distfile in ["config.py", "imres.py", "licence.txt", "environment.py", "logger.py", "tcp.py", "tc.py", "project.py", "tcproject.py", "test.png", "tilecutter.py", "tilecutter.pyw", "main.py"]:
+    for distfile in ["config.py", "imres.py", "licence.txt", "environment.py", "logger.py", "tcp.py", "tc.py", "project.py", "tcproject.py", "tcapp.py", "tccli.py", "tcarray.py", "tcpng.py", "tccache.py", "tcstats.py", "tcoutput.py", "test.png", "tilecutter.py", "tilecutter.pyw", "main.py"]:
         print("Copying file: %s" % distfile)
         shutil.copy(distfile, dist_dir)
 
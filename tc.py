@@ -2,11 +2,24 @@
 #
 # TileCutter Cutting Engine
 
-import logging, io, math, os, sys, subprocess, tempfile
-import wx
-import config
+import hashlib, locale, logging, io, math, os, sys, subprocess, tempfile, time
+import numpy as np
+try:
+    import wx
+except ImportError:
+    # Masks and path handling work without wx, only the wx cutting engine needs it
+    wx = None
+import config, tcoutput, tcpng, tcstats
 config = config.Config()
 
+# Type of source image Project.cut_images should pass to export_cutter
+image_format = "bitmap"
+
+# Running totals for export_composite, for comparing it with other ways of building the output image
+# and reporting how many cells of the output image were saved by removing duplicate and empty tiles
+# and by the layout, compared to a square grid
+composite_counters = {"calls": 0, "bands": 0, "tiles": 0, "seconds": 0.0, "duplicates": 0, "elided": 0, "layout_saved": 0}
+
 class TCMasks:
     """Generates and contains cutting masks for various paksizes"""
     # Whenever a TCMask is made, it checks if that paksize of masks has been generated
@@ -16,154 +29,133 @@ class TCMasks:
     def __init__(self, paksize):
         if paksize not in TCMasks.masksets:
             # Generate new masks
-            TCMasks.masksets[paksize] = TCMaskSet(paksize)
+            with tcstats.stage("mask") as measure:
+                TCMasks.masksets[paksize] = TCMaskSet(paksize)
+                measure.bytes = sum([a.nbytes for a in TCMasks.masksets[paksize].arrays.values()])
+                measure.count = 1
             logging.info("TCMasks - Generated new TCMaskSet for paksize: %s" % paksize)
 
         self.mask = TCMasks.masksets[paksize]
 
 class TCMaskSet:
-    """A set of cutting masks, 1bit bitmaps"""
+    """A set of cutting masks, stored as boolean arrays which are True where the tile is kept
+    wx versions of the masks are only produced when a wx consumer asks for them"""
 
     def __init__(self, p):
-        self.masks = {}
+        self.paksize = p
+        self.arrays = {}
+        self.bitmaps = {}
         # -1 -> Nothing (fully masked)
         a = self.init_new_mask(p)
         self.fill_left(a)
         self.fill_right(a)
-        #a.SaveFile("mask_-1.png", wx.BITMAP_TYPE_PNG)
-        self.masks[-1] = wx.Bitmap(a, 1)
+        self.arrays[-1] = a
 
         # 0 -> Tile only
         a = self.init_new_mask(p)
         self.fill_bottom_triangles(a)
         self.fill_top_left(a)
         self.fill_top_right(a)
-        #a.SaveFile("mask_00.png", wx.BITMAP_TYPE_PNG)
-        self.masks[0] = wx.Bitmap(a, 1)
+        self.arrays[0] = a
 
         # 1 -> Tile and top-right
         a = self.init_new_mask(p)
         self.fill_bottom_triangles(a)
         self.fill_top_left(a)
-        #a.SaveFile("mask_01.png", wx.BITMAP_TYPE_PNG)
-        self.masks[1] = wx.Bitmap(a, 1)
+        self.arrays[1] = a
 
         # 2 -> Tile and top-left
         a = self.init_new_mask(p)
         self.fill_bottom_triangles(a)
         self.fill_top_right(a)
-        #a.SaveFile("mask_02.png", wx.BITMAP_TYPE_PNG)
-        self.masks[2] = wx.Bitmap(a, 1)
+        self.arrays[2] = a
 
         # 3 -> Tile and all top
         a = self.init_new_mask(p)
         self.fill_bottom_triangles(a)
-        #a.SaveFile("mask_03.png", wx.BITMAP_TYPE_PNG)
-        self.masks[3] = wx.Bitmap(a, 1)
+        self.arrays[3] = a
 
         # 4 -> Right side only
         a = self.init_new_mask(p)
         self.fill_left(a)
-        #a.SaveFile("mask_04.png", wx.BITMAP_TYPE_PNG)
-        self.masks[4] = wx.Bitmap(a, 1)
+        self.arrays[4] = a
 
         # 5 -> Left side only
         a = self.init_new_mask(p)
         self.fill_right(a)
-        #a.SaveFile("mask_05.png", wx.BITMAP_TYPE_PNG)
-        self.masks[5] = wx.Bitmap(a, 1)
+        self.arrays[5] = a
 
         # 6 -> Everything (no mask)
         a = self.init_new_mask(p)
-        #a.SaveFile("mask_06.png", wx.BITMAP_TYPE_PNG)
-        self.masks[6] = wx.Bitmap(a, 1)
+        self.arrays[6] = a
 
     def init_new_mask(self, paksize):
         """Create a blank new cutting mask"""
-        mask = wx.Image(paksize, paksize)
-
-        for i in range(paksize):
-            for j in range(paksize):
-                mask.SetRGB(i, j, 255, 255, 255)
-
-        return mask
+        return np.ones((paksize, paksize), dtype=bool)
 
     def fill_bottom_triangles(self, mask):
         """Fill in the bottom left and right triangles for a cutting mask"""
-        paksize = mask.GetWidth()
+        paksize = mask.shape[1]
         half = paksize >> 1
         fourth = paksize >> 2
 
-        for y in range(0, fourth):
-            doubleY = y << 1
-            for x in range(0, doubleY):
-                mask.SetRGB(x, half + fourth + y, 0, 0, 0)
-
-        for y in range(0, fourth):
-            yLeft = paksize - (y << 1)
-            for x in range(yLeft, paksize):
-                mask.SetRGB(x, half + fourth + y, 0, 0, 0)
+        # Row half + fourth + y has its first and last y * 2 pixels masked
+        rows = np.arange(fourth)[:, None] << 1
+        cols = np.arange(paksize)[None, :]
+        mask[half + fourth:half + fourth + fourth][(cols < rows) | (cols >= paksize - rows)] = False
 
         return mask
 
     def fill_left(self, mask):
         """Fill in the entire left half"""
-        paksize = mask.GetWidth()
-        half = paksize >> 1
-
-        for y in range(0, paksize):
-            for x in range(0, half):
-                mask.SetRGB(x, y, 0, 0, 0)
+        mask[:, :mask.shape[1] >> 1] = False
 
         return mask
 
     def fill_right(self, mask):
         """Fill in the entire right half"""
-        paksize = mask.GetWidth()
-        half = paksize >> 1
-
-        for y in range(0, paksize):
-            for x in range(half, paksize):
-                mask.SetRGB(x, y, 0, 0, 0)
+        mask[:, mask.shape[1] >> 1:] = False
 
         return mask
 
     def fill_top_left(self, mask):
         """Fill top-left section of a cutting mask"""
-        paksize = mask.GetWidth()
+        paksize = mask.shape[1]
         half = paksize >> 1
         fourth = paksize >> 2
 
-        for y in range(0, fourth):
-            doubleY = y << 1
-            for x in range(0, doubleY):
-                mask.SetRGB(x, half + fourth - y, 0, 0, 0)
-
-        for y in range(0, half + 1):
-            for x in range(0, half):
-                mask.SetRGB(x, y, 0, 0, 0)
+        # Row half + fourth - y has its first y * 2 pixels masked, rows are stored top to bottom
+        rows = np.arange(fourth - 1, -1, -1)[:, None] << 1
+        cols = np.arange(paksize)[None, :]
+        mask[half + 1:half + fourth + 1][cols < rows] = False
+        mask[:half + 1, :half] = False
 
         return mask
 
     def fill_top_right(self, mask):
         """Fill top-right section of a cutting mask"""
-        paksize = mask.GetWidth()
+        paksize = mask.shape[1]
         half = paksize >> 1
         fourth = paksize >> 2
 
-        for y in range(0, fourth):
-            yLeft = paksize - (y << 1)
-            for x in range(yLeft, paksize):
-                mask.SetRGB(x, half + fourth - y, 0, 0, 0)
-
-        for y in range(0, half + 1):
-            for x in range(half, paksize):
-                mask.SetRGB(x, y, 0, 0, 0)
+        rows = np.arange(fourth - 1, -1, -1)[:, None] << 1
+        cols = np.arange(paksize)[None, :]
+        mask[half + 1:half + fourth + 1][cols >= paksize - rows] = False
+        mask[:half + 1, half:] = False
 
         return mask
 
+    def bitmap(self, key):
+        """Return a 1bit wxBitmap of the specified mask, made the first time it is asked for"""
+        if key not in self.bitmaps:
+            # White pixels in a mask bitmap are kept, black ones are masked
+            data = np.repeat(np.where(self.arrays[key], 255, 0).astype(np.uint8), 3)
+            self.bitmaps[key] = wx.Bitmap(wx.Image(self.paksize, self.paksize, data.tobytes()), 1)
+
+        return self.bitmaps[key]
+
     def __getitem__(self, key):
-        return wx.Mask(self.masks[key])
+        return wx.Mask(self.bitmap(key))
 
 # Take tile coords and convert into screen coords
 def tile_to_screen(pos, dims, off, p, screen_height=None):
@@ -191,33 +183,61 @@ def tile_to_screen(pos, dims, off, p, screen_height=None):
 class Makeobj:
     """Interface class to Makeobj"""
 
-    def __init__(self, path_to_makeobj):
-        """Takes absolute path to makeobj and returns a makeobj control object"""
+    def __init__(self, path_to_makeobj, timeout=None):
+        """Takes absolute path to makeobj and returns a makeobj control object
+        Makeobj is killed if it runs for longer than timeout seconds (None for no limit)"""
         self.path_to_makeobj = path_to_makeobj
+        self.timeout = timeout
 
     def pak(self, paksize, path_to_pak, path_to_dat):
-        """Calls makeobj with appropriate arguments for generating a pakfile"""
+        """Calls makeobj with appropriate arguments for generating a pakfile
+        Returns a tuple of (success, makeobj's output)"""
         # path_to_makeobj pak[paksize] path_to_pak path_to_dat
         # Paths to pak and dat are absolute paths (or relative to makeobj)
-        args = [self.path_to_makeobj, "pak%s" % paksize, path_to_pak, path_to_dat]
-        # Need to convert to system encoding on Windows as CMD interpreter can't do unicode
-        for n, arg in enumerate(args):
-            if isinstance(arg, str):
-                args[n] = arg.encode(sys.getfilesystemencoding())
-
+        return self.run([self.path_to_makeobj, "pak%s" % paksize, path_to_pak, path_to_dat])
+
+    def pak_all(self, paksize, path_to_pak, paths_to_dat):
+        """Calls makeobj once to compile all of the datfiles in paths_to_dat into one pakfile
+        If path_to_pak is a directory, makeobj writes each object to its own pakfile in it instead
+        Returns a tuple of (success, makeobj's output)"""
+        # path_to_makeobj pak[paksize] path_to_pak path_to_dat [path_to_dat...]
+        return self.run([self.path_to_makeobj, "pak%s" % paksize, path_to_pak] + list(paths_to_dat))
+
+    def merge(self, path_to_pak, paths_to_paks):
+        """Calls makeobj to merge the pakfiles in paths_to_paks into one pakfile
+        Returns a tuple of (success, makeobj's output)"""
+        # path_to_makeobj merge path_to_pak path_to_pak [path_to_pak...]
+        return self.run([self.path_to_makeobj, "merge", path_to_pak] + list(paths_to_paks))
+
+    def run(self, args):
+        """Run makeobj with args (including the path to makeobj), returns a tuple of (success, makeobj's output)"""
         logging.info("Activating Makeobj with arguments: %s" % str(args))
-        process = subprocess.Popen(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-        process.wait()
-        # Write out makeobj log information to main log
-        output = process.communicate()
+        try:
+            # stderr is merged into stdout so messages stay in the order makeobj wrote them
+            process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            logging.error("Makeobj could not be run: %s" % e)
+            return (False, str(e))
+        # communicate reads output while waiting, so makeobj can't block on a full pipe
+        try:
+            output = process.communicate(timeout=self.timeout)[0]
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output = process.communicate()[0]
+            logging.error("Makeobj killed after running for more than %s seconds" % self.timeout)
+            return (False, output.decode(locale.getpreferredencoding(False), "replace"))
+        output = output.decode(locale.getpreferredencoding(False), "replace")
 
-        if output[0] != "":
-            logging.debug(output[0])
+        # Write out makeobj log information to main log
+        if output != "":
+            logging.debug(output)
 
-        if output[1] != "":
-            logging.debug(output[1])
+        if process.returncode != 0:
+            logging.error("Makeobj failed with exit code: %s" % process.returncode)
+            return (False, output)
 
         logging.info("Makeobj output complete")
+        return (True, output)
 
 class Paths(object):
     """Advanced path manipulation functions"""
@@ -322,26 +342,20 @@ class Paths(object):
         """Convert windows style path blah\\meh to unix style blah/meh"""
         return path.replace("\\", "/")
 
-def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
-    """Write a project's dat and png files"""
-    # Runs after export_cutter has been called for all active images in the project,
-    # uses information generated by it to output files ready for makeobj compilation
+def export_paths(project):
+    """Return absolute paths to a project's .dat, .png and .pak output files,
+    plus the path from the .dat file to the .png file (without extension) for use in the .dat"""
     paths = Paths()
     dat_path = paths.join_paths(project.save_location(), project.datfile_location())
     png_path = paths.join_paths(project.save_location(), project.pngfile_location())
     pak_path = paths.join_paths(project.save_location(), project.pakfile_location())
-    logging.info("e_w: export_writer init")
-    logging.info("e_w: Writing .png to file: %s" % png_path)
-
-    if project.datfile_write():
-        logging.debug("e_w: Writing .dat info to file: %s" % dat_path)
-    else:
-        logging.debug("e_w: Writing .dat info to console")
-
-    # Get path from dat file location to png file location
     dat_to_png = os.path.splitext(paths.compare_paths(png_path, dat_path))[0]
-    logging.debug("e_w: Path from .dat to .png is: %s" % dat_to_png)
+    return dat_path, png_path, pak_path, dat_to_png
 
+def export_list(project):
+    """Return the list of cut images to be output for a project, in output order
+    Each item is [cut image, {"d", "s", "f", "l", "x", "y", "z"}, None], the writer
+    sets the last value to the (row, column) of the image within the output .png"""
     # First calculate the size of output image required, this depends on a number of factors
     # - Dimensions of the image, x*y images for first layer + (x+y-1)*(z-1) images for higher layers
     # - Number of views, 1-4
@@ -361,16 +375,9 @@ def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
     zdims = project.z()
     layers = project.frontimage() + 1 # +1 as this value is stored as an 0 or 1, we need 1 or 2
     views = project.directions()
-    bgcolor = (0, 0, 0, 0) if project.transparency() else config.transparent
-    seasons = 1 + project.seasons(season="snow"); # +1 for summer, +1 if has snow
-    seasons_img = [0, 1] # image indexes in project
-    autumn = project.seasons(season="autumn")
-    winter = project.seasons(season="winter")
-    spring = project.seasons(season="spring")
-    if autumn == 1 or winter == 1 or spring == 1:
-        # +3 if has any other season
-        seasons += 3
-        seasons_img = [0, 2*autumn, 3*winter, 4*spring, 1]
+    # Image indexes in project of each season output, 1 for summer, +1 if has snow, +3 if has any other season
+    seasons_img = project.season_images()
+    seasons = len(seasons_img)
 
     logging.info("e_w: Outputting using paksize: %s" % p)
     logging.info("e_w: Outputting %s front/backimages" % layers)
@@ -378,21 +385,6 @@ def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
     logging.info("e_w: Outputting %s seasons" % seasons)
     logging.info("e_w: Outputting dims: x:%s, y:%s, z:%s" % (xdims, ydims, zdims))
 
-    # Calculate dimensions of output image
-    dims = (xdims * ydims) + ((xdims + ydims - 1) * (zdims - 1))
-    totalimages = dims * layers * views * seasons
-    side = int(math.ceil(math.sqrt(totalimages)))
-
-    logging.info("e_w: Outputting %s images total, output size %sx%sp (%sx%spx)" % (totalimages, side, side, side*p, side*p))
-
-    # Init output bitmap and dc for drawing into it
-    output_bitmap = wx.Bitmap(side*p, side*p)
-    outdc = wx.MemoryDC()
-    outdc.SelectObject(output_bitmap)
-    gdc = wx.GCDC(outdc)
-    gdc.SetBackground(wx.Brush(bgcolor, wx.SOLID))
-    gdc.Clear()
-
     # A list can now be produced of all images to be output
     # project[view][season][frame][layer][xdim][ydim][zdim] = [bitmap, (xposout, yposout)]
     output_list = []
@@ -416,35 +408,15 @@ def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
                                 if (z > 0 and (x == 0 or y == 0)) or z == 0:
                                     output_list.append([project.get_cut_image(d, seasons_img[s], f, l, x, y, z), {"d":d, "s":s, "f":f, "l":l, "x":x, "y":y, "z":z}, None])
 
-    # Now that a list of component images has been generated, output these in sequence
-    x = 0
-    y = 0
-
-    for k in output_list:
-        # a bug in wxWidget doesn't keep transparency when done in memory for more than two operations
-        k[0].SaveFile("tc_temp.png", wx.BITMAP_TYPE_PNG)
-        cut_image = wx.Bitmap("tc_temp.png")
-        gdc.DrawBitmap(cut_image, x*p, y*p, True)
-        # Makeobj references the image array by row,column, e.g. y,x, so switch these
-        k[2] = (y, x)
-        x += 1
-
-        if x == side:
-            x = 0
-            y += 1
-
-    # Select bitmap out of dc ready for saving
-    outdc.SelectObject(wx.NullBitmap)
-    os.remove("tc_temp.png")
-
-    # output_bitmap now contains the image array
-    logging.info("e_w: Image output complete")
+    return output_list
 
+def export_dat(project, output_list, dat_to_png):
+    """Return the .dat file text for a project, once output positions are set in output_list"""
     output_text = io.StringIO()
     # Test text
     output_text.write(project.dat_lump() + "\n")
     # dims=East-West, North-south, Views
-    output_text.write("dims=%s,%s,%s\n" % (ydims, xdims, views))
+    output_text.write("dims=%s,%s,%s\n" % (project.y(), project.x(), project.directions()))
 
     for k in output_list:
         # (d, s, f, l, x, y, z)
@@ -456,10 +428,325 @@ def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
             imtext = "FrontImage"
 
         # imtext[direction][x][y][z][frame][season]=filename.xpos.ypos
-        output_text.write("%s[%s][%s][%s][%s][%s][%s]=%s.%s.%s\n" % (
-            imtext, j["d"], j["x"], j["y"], j["z"], j["f"], j["s"], paths.win_to_unix(dat_to_png), k[2][0], k[2][1]))
+        output_text.write("%s[%s][%s][%s][%s][%s][%s]=%s\n" % (
+            imtext, j["d"], j["x"], j["y"], j["z"], j["f"], j["s"], image_ref(dat_to_png, k[2])))
 
-    dat_text = output_text.getvalue()
+    return output_text.getvalue()
+
+def image_ref(dat_to_png, position):
+    """Return the reference to an image at position within the output image, as written in the .dat file"""
+    paths = Paths()
+    # Images left out of the output image are empty, which makeobj writes as "-"
+    if position is None:
+        return "-"
+    elif len(position) == 2:
+        return "%s.%s.%s" % (paths.win_to_unix(dat_to_png), position[0], position[1])
+    else:
+        # Output image split into pages, filename_page.xpos.ypos
+        return "%s_%s.%s.%s" % (paths.win_to_unix(dat_to_png), position[0], position[1], position[2])
+
+def background(transparency):
+    """Return the RGBA background colour used for a project's output"""
+    if transparency:
+        return (0, 0, 0, 0)
+    else:
+        return tuple(config.transparent) + (255,)
+
+def bitmap_to_array(bitmap):
+    """Return an RGBA array of shape (height, width, 4) with the contents of a wx.Bitmap"""
+    image = bitmap.ConvertToImage()
+    array = np.empty((image.GetHeight(), image.GetWidth(), 4), np.uint8)
+    array[:, :, :3] = np.frombuffer(bytes(image.GetData()), np.uint8).reshape(array.shape[0], array.shape[1], 3)
+    if image.HasAlpha():
+        array[:, :, 3] = np.frombuffer(bytes(image.GetAlpha()), np.uint8).reshape(array.shape[:2])
+    else:
+        array[:, :, 3] = 255
+    return array
+
+def export_shape(count, p, layout="square", max_width=0):
+    """Return the number of (rows, columns) of cells in an output image for count images of paksize p
+    The "square" layout uses the smallest square grid, "tight" the grid with the fewest cells, of those
+    the most square. If max_width is set the output image is no wider than max_width pixels"""
+    # Output image must be at least one cell in size, even if all images were left out
+    count = max(1, count)
+    max_cols = count
+    if max_width:
+        max_cols = max(1, min(count, max_width // p))
+
+    if layout == "tight":
+        shapes = []
+        for cols in range(1, max_cols + 1):
+            rows = int(math.ceil(count / float(cols)))
+            shapes.append((rows * cols, abs(rows - cols), -cols, rows))
+        cells, squareness, cols, rows = min(shapes)
+        return rows, -cols
+    else:
+        side = int(math.ceil(math.sqrt(count)))
+        if side <= max_cols:
+            # Square grid, even if the last rows are empty
+            return side, side
+        else:
+            return int(math.ceil(count / float(max_cols))), max_cols
+
+def export_layout(output_list, p, transparency, dedup=False, elide=False, layout="square", max_width=0, max_pixels=0):
+    """Work out where each of the cut images (as RGBA arrays) in output_list is placed in the output
+    Returns a list of pages, each a tuple of (images, rows, columns), with the images placed left to right,
+    top to bottom in a grid shaped according to layout and max_width (see export_shape)
+    Each item's position is set in output_list, as (row, column), or as (page, row, column) if there
+    is more than one page. Pages are no larger than max_pixels, if set
+    If dedup is True, images with identical pixels are only placed once and share a position
+    If elide is True, images with no visible pixels are left out and their position is set to None"""
+    bgcolor = background(transparency)
+
+    # Work out which cell of the output each item uses
+    tiles = []
+    cells = []
+    unique = {}
+    elided = 0
+    for k in output_list:
+        tile = np.ascontiguousarray(k[0])
+        if elide:
+            # Pixels are visible if drawn, and when drawn onto a background if they differ from it
+            visible = tile[:, :, 3] > 0
+            if not transparency:
+                visible &= (tile != bgcolor).any(axis=2)
+            if not visible.any():
+                cells.append(None)
+                elided += 1
+                continue
+        if dedup:
+            # Only visible pixels matter, fully transparent pixels are never drawn
+            key = hashlib.sha1(np.where(tile[:, :, 3:] > 0, tile, 0).tobytes()).digest()
+            if key not in unique:
+                unique[key] = len(tiles)
+                tiles.append(tile)
+            cells.append(unique[key])
+        else:
+            cells.append(len(tiles))
+            tiles.append(tile)
+
+    # Split images between pages, each holding as many as fit within max_pixels
+    totalimages = len(tiles)
+    per_page = max(1, totalimages)
+    if max_pixels:
+        max_cells = max(1, max_pixels // (p * p))
+        per_page = min(per_page, max_cells)
+        # Grid may have more cells than images, which also count towards the size of the page
+        while per_page > 1:
+            rows, cols = export_shape(per_page, p, layout, max_width)
+            if rows * cols <= max_cells:
+                break
+            per_page -= 1
+
+    pages = []
+    for first in range(0, max(1, totalimages), per_page):
+        page_tiles = tiles[first:first + per_page]
+        rows, cols = export_shape(len(page_tiles), p, layout, max_width)
+        pages.append((page_tiles, rows, cols))
+
+    for k, n in zip(output_list, cells):
+        # Makeobj references the image array by row,column, e.g. y,x
+        if n is None:
+            k[2] = None
+        else:
+            page, n = divmod(n, per_page)
+            if len(pages) == 1:
+                k[2] = divmod(n, pages[page][2])
+            else:
+                k[2] = (page,) + divmod(n, pages[page][2])
+
+    duplicates = len(output_list) - elided - totalimages
+    side = max(1, int(math.ceil(math.sqrt(totalimages))))
+    # Paging, or a narrow max_width, can need more cells than a square, which saves nothing
+    layout_saved = max(0, side * side - sum([rows * cols for page_tiles, rows, cols in pages]))
+
+    logging.info("e_w: Outputting %s images total (%s duplicates and %s empty images removed) on %s pages, %s cells smaller than a square" % (totalimages, duplicates, elided, len(pages), layout_saved))
+
+    composite_counters["duplicates"] += duplicates
+    composite_counters["elided"] += elided
+    composite_counters["layout_saved"] += layout_saved
+    return pages
+
+def export_composite(tiles, p, transparency, rows, cols, band=False):
+    """Build an output image from a list of cut images (as RGBA arrays) placed left to right, top to bottom
+    in a grid of rows x cols cells, returns an RGBA array
+    If band is True this is one band of a larger output image, which is counted as a band rather than a call,
+    the caller counts the call for the whole output image"""
+    start = time.perf_counter()
+
+    logging.debug("e_w: Output size %sx%sp (%sx%spx)" % (cols, rows, cols*p, rows*p))
+
+    with tcstats.stage("composite") as measure:
+        output_array = np.empty((rows * p, cols * p, 4), np.uint8)
+        output_array[:] = background(transparency)
+        # Pixels are copied as whole 32bit RGBA values
+        output_pixels = output_array.view(np.uint32)[:, :, 0]
+
+        for n, tile in enumerate(tiles):
+            y, x = divmod(n, cols)
+            # Pixels outside of the tile's cutting mask are fully transparent, and are not drawn
+            np.copyto(output_pixels[y*p:(y+1)*p, x*p:(x+1)*p], tile.view(np.uint32)[:, :, 0], where=tile[:, :, 3] > 0)
+        measure.bytes = output_array.nbytes
+        measure.count = len(tiles)
+
+    if band:
+        composite_counters["bands"] += 1
+    else:
+        composite_counters["calls"] += 1
+    composite_counters["tiles"] += len(tiles)
+    composite_counters["seconds"] += time.perf_counter() - start
+    return output_array
+
+def page_path(path, page):
+    """Return the path of page number page of the output image at path"""
+    root, ext = os.path.splitext(path)
+    return "%s_%s%s" % (root, page, ext)
+
+def export_output(project, output_list, pak_output=False, return_dat=False, write_dat=True,
+                  dedup=None, elide=None, layout=None, max_width=None, max_pixels=None, makeobj=None):
+    """Write out a project's dat and png files from its list of cut images (as RGBA arrays)
+    If dedup is True, identical images are only included in the png once, if elide is True empty images are
+    left out of the png, layout and max_width set the shape of the png (see export_shape), max_pixels the
+    maximum size of the png, which is split into pages if needed. All default to config settings
+    makeobj is passed on to export_files"""
+    dat_path, png_path, pak_path, dat_to_png = export_paths(project)
+
+    if dedup is None:
+        dedup = config.export_dedup
+    if elide is None:
+        elide = config.export_elide_empty
+    if layout is None:
+        layout = config.export_layout
+    if max_width is None:
+        max_width = config.export_max_width
+    if max_pixels is None:
+        max_pixels = config.export_max_pixels
+
+    p = project.paksize()
+    transparency = project.transparency()
+    # Finding duplicate and empty images is part of building the output image
+    with tcstats.stage("composite"):
+        pages = export_layout(output_list, p, transparency, dedup, elide, layout, max_width, max_pixels)
+
+    # Without transparency the output has no alpha channel
+    channels = 4 if transparency else 3
+
+    def save_png(path):
+        """Write out each page of the output image in turn, a row of images at a time,
+        so only one row of images is in memory at once"""
+        for page, (tiles, rows, cols) in enumerate(pages):
+            if len(pages) > 1:
+                f = tcoutput.OutputFile(page_path(path, page))
+            else:
+                f = tcoutput.OutputFile(path)
+            # Left untouched if the image hasn't changed, which the encoder's fixed settings make possible
+            with f:
+                writer = tcpng.Writer(f, cols * p, rows * p, channels)
+                composite_counters["calls"] += 1
+                for row in range(rows):
+                    band = export_composite(tiles[row * cols:(row + 1) * cols], p, transparency, 1, cols, band=True)
+                    with tcstats.stage("encode"):
+                        writer.write(band[:, :, :channels])
+                with tcstats.stage("encode") as measure:
+                    writer.close()
+                    measure.bytes = f.tell()
+                    measure.count = 1
+        logging.info("e_w: Image output complete")
+
+    with tcstats.stage("dat"):
+        dat_text = export_dat(project, output_list, dat_to_png)
+
+    export_files(project, dat_text, save_png, pak_output, write_dat, makeobj)
+
+    # Return dat file text (e.g. for output within the program in a dialog box etc.)
+    if return_dat:
+        return dat_text
+    else:
+        return True
+
+def pak_file(paksize, pak_path, dat_path, remove_dat=False, timeout=None):
+    """Compile the .dat file at dat_path into a .pak file at pak_path using makeobj, returns a tuple of
+    (success, makeobj's output). If remove_dat is True the .dat file is deleted afterwards
+    Makeobj is killed after timeout seconds, which defaults to the config setting (0 for no limit)"""
+    return pak_files(pak_path, [(paksize, dat_path, remove_dat)], timeout)
+
+# Most characters of .dat file paths passed to one run of makeobj, command lines on Windows are limited to 32767
+max_makeobj_args = 30000
+
+def pak_files(pak_path, dats, timeout=None, record=True):
+    """Compile several .dat files into one .pak file at pak_path using as few runs of makeobj as possible,
+    returns a tuple of (success, makeobj's output). dats is a list of (paksize, dat_path, remove_dat)
+    Each paksize is compiled by its own run of makeobj, as are .dat files which don't fit on one command line,
+    these are then merged into the .pak file. Temporary .dat files (remove_dat True) are deleted afterwards
+    If record is False the .pak file isn't added to the active tcstats report (see tcoutput.replace_if_changed)"""
+    paths = Paths()
+    if timeout is None:
+        timeout = config.makeobj_timeout
+    makeobj = Makeobj(paths.join_paths(os.getcwd(), config.path_to_makeobj), timeout or None)
+
+    # Split into parts of a single paksize, each compiled by one run of makeobj
+    parts = []
+    for paksize in sorted(set([d[0] for d in dats])):
+        part = []
+        length = 0
+        for size, dat_path, remove_dat in dats:
+            if size != paksize:
+                continue
+            dat_path = paths.win_to_unix(dat_path)
+            if part and length + len(dat_path) > max_makeobj_args:
+                parts.append((paksize, part))
+                part = []
+                length = 0
+            part.append(dat_path)
+            length += len(dat_path) + 1
+        parts.append((paksize, part))
+
+    # Output to a directory is a .pak file per object, so there is nothing to merge
+    single_file = os.path.split(pak_path)[1] != "" and not os.path.isdir(pak_path)
+    merge = len(parts) > 1 and single_file
+    # A single .pak file is compiled to a temporary file first, so an unchanged .pak file is left untouched
+    # (makeobj needs the .pak extension to write a file rather than a directory)
+    if single_file and os.path.isdir(os.path.split(pak_path)[0] or os.curdir):
+        output_path = tcoutput.temporary_path(pak_path, ".tmp.pak")
+    else:
+        output_path = pak_path
+    part_paths = []
+    outputs = []
+    success = True
+    try:
+        for n, (paksize, part) in enumerate(parts):
+            if merge:
+                part_paths.append("%s_part%s.pak" % (os.path.splitext(pak_path)[0], n))
+                target = part_paths[-1]
+            else:
+                target = output_path
+            success, output = makeobj.pak_all(paksize, paths.win_to_unix(target), part)
+            outputs.append(output)
+            if not success:
+                break
+        if merge and success:
+            success, output = makeobj.merge(paths.win_to_unix(output_path), [paths.win_to_unix(p) for p in part_paths])
+            outputs.append(output)
+        if output_path != pak_path and success:
+            tcoutput.replace_if_changed(output_path, pak_path, record)
+    finally:
+        if output_path != pak_path and os.path.isfile(output_path):
+            os.remove(output_path)
+        for part_path in part_paths:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+        for size, dat_path, remove_dat in dats:
+            if remove_dat:
+                logging.debug("e_w: deleting temporary file used: %s" % dat_path)
+                os.remove(dat_path)
+    return (success, "".join(outputs))
+
+def export_files(project, dat_text, save_png, pak_output=False, write_dat=True, makeobj=None):
+    """Write out a project's .dat file and .png file (by calling save_png with the path to write to)
+    then compile the .pak file with makeobj if required
+    If makeobj is given, it is called with (paksize, pak_path, dat_path, remove_dat) instead of compiling
+    the .pak file here, so that makeobj can be run later (see pak_file)"""
+    dat_path, png_path, pak_path, dat_to_png = export_paths(project)
 
     # Write out to files if required
     if write_dat:
@@ -468,50 +755,103 @@ def export_writer(project, pak_output=False, return_dat=False, write_dat=True):
         if not os.path.isdir(os.path.split(dat_path)[0]):
             os.makedirs(os.path.split(dat_path)[0])
 
-        f = open(dat_path, "w")
+        f = tcoutput.OutputFile(dat_path, "w")
     else:
         logging.info("e_w: Writing out .dat file to temporary file")
-        tempfile.tempdir = os.path.split(dat_path)[0]
-        f = tempfile.NamedTemporaryFile("w", suffix=".tmp", delete=False)
+        # Alongside the .dat file, as makeobj references the .png relative to it
+        f = tempfile.NamedTemporaryFile("w", suffix=".tmp", dir=os.path.split(dat_path)[0], delete=False)
         dat_path = f.name
 
     # Write .dat file
-    f.write(dat_text)
-    f.close()
+    with tcstats.stage("dat") as measure:
+        f.write(dat_text)
+        f.close()
+        measure.bytes = len(dat_text.encode("utf-8"))
+        measure.count = 1
 
     # Check that each component in png_path exists, create directories if needed
     if not os.path.isdir(os.path.split(png_path)[0]):
         os.makedirs(os.path.split(png_path)[0])
 
     # Write out .png file
-    output_bitmap.SaveFile(png_path, wx.BITMAP_TYPE_PNG)
-
-    if pak_output:
-        # Output .pak file using makeobj if required
-        logging.info("e_w: Use makeobj to output pak file")
-        path_to_makeobj = paths.join_paths(os.getcwd(), config.path_to_makeobj)
-        makeobj = Makeobj(path_to_makeobj)
-        print(repr(pak_path))
-        print(repr(dat_path))
-        makeobj.pak(project.paksize(), paths.win_to_unix(pak_path), paths.win_to_unix(dat_path))
-
-    # Delete temporary file if needed
-    if not write_dat:
-        logging.debug("e_w: deleting temporary file used: %s" % dat_path)
-        os.remove(dat_path)
+    save_png(png_path)
+
+    if pak_output and makeobj is not None:
+        # Caller runs makeobj, and deletes the .dat file afterwards if it is temporary
+        makeobj(project.paksize(), pak_path, dat_path, not write_dat)
+    else:
+        if pak_output:
+            # Output .pak file using makeobj if required
+            logging.info("e_w: Use makeobj to output pak file")
+            with tcstats.stage("makeobj") as measure:
+                pak_file(project.paksize(), pak_path, dat_path)
+                if os.path.isfile(pak_path):
+                    measure.bytes = os.path.getsize(pak_path)
+                measure.count = 1
+
+        # Delete temporary file if needed
+        if not write_dat:
+            logging.debug("e_w: deleting temporary file used: %s" % dat_path)
+            os.remove(dat_path)
 
     # Log .dat file generated
     logging.debug("e_w: .dat file text is:")
     logging.debug(dat_text)
 
-    # Return dat file text (e.g. for output within the program in a dialog box etc.)
-    if return_dat:
-        return dat_text
+def export_writer(project, pak_output=False, return_dat=False, write_dat=True, **options):
+    """Write a project's dat and png files
+    Other keyword arguments (e.g. dedup, elide, layout) are passed on to export_output"""
+    # Runs after export_cutter has been called for all active images in the project,
+    # uses information generated by it to output files ready for makeobj compilation
+    dat_path, png_path, pak_path, dat_to_png = export_paths(project)
+    logging.info("e_w: export_writer init")
+    logging.info("e_w: Writing .png to file: %s" % png_path)
+
+    if project.datfile_write():
+        logging.debug("e_w: Writing .dat info to file: %s" % dat_path)
     else:
-        return True
+        logging.debug("e_w: Writing .dat info to console")
+
+    # Get path from dat file location to png file location
+    logging.debug("e_w: Path from .dat to .png is: %s" % dat_to_png)
+
+    return export_output(project, export_list(project), pak_output, return_dat, write_dat, **options)
+
+def tile_mask(x, y, z):
+    """Return the key of the cutting mask used for the tile at position x, y, z"""
+    # Changes to cutting which alter cut images need tccache.tile_version increasing
+    if z == 0:
+        if x == 0 and y == 0:
+            return 3
+        elif x == 0 and y != 0:
+            return 1
+        elif x != 0 and y == 0:
+            return 2
+        else:
+            return 0
+    else:
+        if x == 0 and y == 0:
+            return 6
+        elif x == 0 and y != 0:
+            return 4
+        elif x != 0 and y == 0:
+            return 5
+        else:
+            return -1
+
+def apply_mask(bitmap, keep):
+    """Return a copy of bitmap with all pixels outside of the mask array keep made fully transparent
+    Transparency is stored in the alpha channel rather than a wx.Mask, as a wx.Mask is lost
+    when the bitmap is drawn onto another in memory"""
+    image = bitmap.ConvertToImage()
+    if not image.HasAlpha():
+        image.InitAlpha()
+    alpha = np.frombuffer(bytes(image.GetAlpha()), np.uint8).reshape(keep.shape)
+    image.SetAlpha(np.where(keep, alpha, 0).astype(np.uint8).tobytes())
+    return wx.Bitmap(image)
 
 def export_cutter(bitmap, dims, offset, p, transparency):
-    """Takes a bitmap and dimensions, and returns an array of masked bitmaps"""
+    """Takes a bitmap and dimensions, and returns an (x, y, z, p, p, 4) RGBA array of masked images"""
     logging.info("e_c: export_cutter init")
     logging.debug("e_c: Passed in bitmap of size (x, y): (%s, %s)" % (bitmap.GetWidth(), bitmap.GetHeight()))
     logging.debug("e_c: Dims (x, y, z, d): %s" % str(dims))
@@ -527,15 +867,16 @@ def export_cutter(bitmap, dims, offset, p, transparency):
 
     # Based on the paksize of the project, cut it into little bits which are stored in an array
     # ready for the next stage of the process
-    # Use wx.Bitmap.GetSubBitmap to grab the correct paksize section, then set the Bitmap's mask to
-    # the appropriate masking image which is generated automatically for each paksize the first time
+    # Use wx.Bitmap.GetSubBitmap to grab the correct paksize section, then set the Bitmap's alpha from
+    # the appropriate masking array which is generated automatically for each paksize the first time
     # the mask provider function is called with that particular paksize
+    # Each masked bitmap is copied into one array of all the cut images, rather than kept
 
     # Init mask provider
     masks = TCMasks(p)
 
     logging.info("e_c: Building output array...")
-    output_array = []
+    output_array = np.empty(dims + (p, p, 4), np.uint8)
     # Must ensure that the source bitmap is large enough so that all subbitmap operations succeed
     # Extend to the right and up
     # Max height will be offy + (dimsx+dimsy)*p/4 + p/2 + p*(dimsz-1)
@@ -561,30 +902,11 @@ def export_cutter(bitmap, dims, offset, p, transparency):
     tdc.SelectObject(wx.NullBitmap)
 
     for x in range(dims[0]):
-        yarray = []
         for y in range(dims[1]):
-            zarray = []
             for z in range(dims[2]):
                 pos = tile_to_screen((x, y, z), dims, offset, p, source_bitmap.GetHeight())
                 submap = source_bitmap.GetSubBitmap((pos[0], pos[1], p, p))
-                if z == 0:
-                    if x == 0 and y == 0:
-                        submap.SetMask(masks.mask[3])
-                    elif x == 0 and y != 0:
-                        submap.SetMask(masks.mask[1])
-                    elif x != 0 and y == 0:
-                        submap.SetMask(masks.mask[2])
-                    else:
-                        submap.SetMask(masks.mask[0])
-                else:
-                    if x == 0 and y == 0:
-                        submap.SetMask(masks.mask[6])
-                    elif x == 0 and y != 0:
-                        submap.SetMask(masks.mask[4])
-                    elif x != 0 and y == 0:
-                        submap.SetMask(masks.mask[5])
-                    else:
-                        submap.SetMask(masks.mask[-1])
+                submap = apply_mask(submap, masks.mask.arrays[tile_mask(x, y, z)])
 
                 # sub = wx.Bitmap(p, p)
                 # tdc = wx.MemoryDC()
@@ -596,10 +918,7 @@ def export_cutter(bitmap, dims, offset, p, transparency):
                 # tdc.SelectObject(wx.NullBitmap)
                 # submap.SaveFile("test_%s%s%s.png" % (x, y, z), wx.BITMAP_TYPE_PNG)
 
-                # submap = Bitmap + Mask, Second variable stores location of this tile within
-                #                         the output image as a tuple
-                zarray.append(submap)
-            yarray.append(zarray)
-        output_array.append(yarray)
+                # submap = Bitmap with masked pixels transparent
+                output_array[x, y, z] = bitmap_to_array(submap)
     logging.info("e_c: Build output array complete, exiting")
     return output_array
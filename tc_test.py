@@ -0,0 +1,356 @@
+#!/usr/bin/python
+
+"""Unit test for tc.py"""
+
+import tc
+import unittest
+import os, shutil, sys, tempfile, time
+from unittest import mock
+
+import config
+config = config.Config()
+
+
+def reference_mask(p, fills):
+    """Build a mask the way the old per-pixel wx.Image.SetRGB loops did, as nested lists"""
+    half = p >> 1
+    fourth = p >> 2
+    mask = [[True] * p for y in range(p)]
+
+    for fill in fills:
+        if fill == "bottom_triangles":
+            for y in range(0, fourth):
+                for x in range(0, y << 1):
+                    mask[half + fourth + y][x] = False
+            for y in range(0, fourth):
+                for x in range(p - (y << 1), p):
+                    mask[half + fourth + y][x] = False
+        elif fill == "left":
+            for y in range(0, p):
+                for x in range(0, half):
+                    mask[y][x] = False
+        elif fill == "right":
+            for y in range(0, p):
+                for x in range(half, p):
+                    mask[y][x] = False
+        elif fill == "top_left":
+            for y in range(0, fourth):
+                for x in range(0, y << 1):
+                    mask[half + fourth - y][x] = False
+            for y in range(0, half + 1):
+                for x in range(0, half):
+                    mask[y][x] = False
+        elif fill == "top_right":
+            for y in range(0, fourth):
+                for x in range(p - (y << 1), p):
+                    mask[half + fourth - y][x] = False
+            for y in range(0, half + 1):
+                for x in range(half, p):
+                    mask[y][x] = False
+
+    return mask
+
+class TCMaskSet(unittest.TestCase):
+    """Test generation of cutting masks"""
+    fills = {
+        -1: ["left", "right"],
+        0: ["bottom_triangles", "top_left", "top_right"],
+        1: ["bottom_triangles", "top_left"],
+        2: ["bottom_triangles", "top_right"],
+        3: ["bottom_triangles"],
+        4: ["left"],
+        5: ["right"],
+        6: [],
+    }
+
+    def test_matches_reference(self):
+        """Test that masks match those produced by the per-pixel loops for all paksizes"""
+        for p in config.choicelist_paksize:
+            maskset = tc.TCMaskSet(p)
+            for key, fills in self.fills.items():
+                self.assertEqual(reference_mask(p, fills), maskset.arrays[key].tolist(), "paksize %s, mask %s" % (p, key))
+
+    def test_masksets_cached(self):
+        """Test that a maskset is only generated once per paksize"""
+        self.assertTrue(tc.TCMasks(64).mask is tc.TCMasks(64).mask)
+
+@unittest.skipIf(tc.wx is None, "wx not installed")
+class apply_mask(unittest.TestCase):
+    """Test conversion of cutting masks to alpha"""
+
+    def test_alpha_from_mask(self):
+        """Test that masked pixels are transparent and others keep their colour"""
+        app = tc.wx.App()
+        keep = tc.TCMasks(32).mask.arrays[0]
+        image = tc.wx.Image(32, 32)
+        image.SetRGB(tc.wx.Rect(0, 0, 32, 32), 10, 20, 30)
+        masked = tc.apply_mask(tc.wx.Bitmap(image), keep).ConvertToImage()
+        self.assertTrue(masked.HasAlpha())
+        for x, y in [(0, 0), (16, 16), (0, 31), (31, 20)]:
+            self.assertEqual(masked.GetAlpha(x, y), 255 if keep[y, x] else 0)
+            self.assertEqual((masked.GetRed(x, y), masked.GetGreen(x, y), masked.GetBlue(x, y)), (10, 20, 30))
+
+class export_shape(unittest.TestCase):
+    """Test choice of output image shape"""
+
+    def test_square(self):
+        """Test that the square layout matches the original ceil(sqrt) grid"""
+        for count in range(1, 200):
+            side = int(tc.math.ceil(tc.math.sqrt(count)))
+            self.assertEqual(tc.export_shape(count, 64), (side, side))
+
+    def test_tight(self):
+        """Test that the tight layout has the fewest cells, and is never larger than the square one"""
+        self.assertEqual(tc.export_shape(5, 64, "tight"), (1, 5))
+        self.assertEqual(tc.export_shape(10, 64, "tight"), (2, 5))
+        self.assertEqual(tc.export_shape(12, 64, "tight"), (3, 4))
+        for count in range(1, 200):
+            rows, cols = tc.export_shape(count, 64, "tight")
+            side = int(tc.math.ceil(tc.math.sqrt(count)))
+            self.assertTrue(count <= rows * cols <= side * side)
+
+    def test_max_width(self):
+        """Test that the output image is never wider than the maximum"""
+        self.assertEqual(tc.export_shape(10, 64, "square", 128), (5, 2))
+        self.assertEqual(tc.export_shape(10, 64, "tight", 192), (5, 2))
+        self.assertEqual(tc.export_shape(10, 64, "square", 1000), (4, 4))
+        self.assertEqual(tc.export_shape(3, 64, "tight", 10), (3, 1))
+
+def solid_tiles(p, values):
+    """Return an output list of tiles of paksize p, each filled with a colour based on a value from values"""
+    output_list = []
+    for n in values:
+        tile = tc.np.zeros((p, p, 4), tc.np.uint8)
+        tile[:, :] = (n, 10, 20, 255)
+        # Colour of fully transparent pixels doesn't matter
+        tile[0, 0] = (n * 50 % 256, 0, 0, 0)
+        output_list.append([tile, {}, None])
+    return output_list
+
+class export_layout(unittest.TestCase):
+    """Test placement of cut images in the output image"""
+
+    def test_grid(self):
+        """Test that tiles are placed in rows of a square grid"""
+        output_list = solid_tiles(16, range(5))
+        pages = tc.export_layout(output_list, 16, False)
+        self.assertEqual([(len(tiles), rows, cols) for tiles, rows, cols in pages], [(5, 3, 3)])
+        self.assertEqual([k[2] for k in output_list], [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1)])
+
+    def test_dedup(self):
+        """Test that identical tiles share a cell when dedup is on"""
+        output_list = solid_tiles(16, [0, 1, 0, 2, 1])
+        pages = tc.export_layout(output_list, 16, True, dedup=True)
+        self.assertEqual([(len(tiles), rows, cols) for tiles, rows, cols in pages], [(3, 2, 2)])
+        self.assertEqual([k[2] for k in output_list], [(0, 0), (0, 1), (0, 0), (1, 0), (0, 1)])
+
+    def test_elide(self):
+        """Test that tiles with nothing visible are left out when elide is on"""
+        p = 16
+        empty = tc.np.zeros((p, p, 4), tc.np.uint8)
+        background = tc.np.zeros((p, p, 4), tc.np.uint8)
+        background[:, :] = list(config.transparent) + [255]
+        solid = tc.np.zeros((p, p, 4), tc.np.uint8)
+        solid[4, 4] = (1, 2, 3, 255)
+        output_list = [[tile, {}, None] for tile in [empty, solid, background, solid]]
+        elided = tc.composite_counters["elided"]
+        tc.export_layout(output_list, p, False, elide=True)
+        self.assertEqual([k[2] for k in output_list], [None, (0, 0), None, (0, 1)])
+        self.assertEqual(tc.composite_counters["elided"], elided + 2)
+        # Tiles the same colour as the background are only empty without transparency
+        tc.export_layout(output_list, p, True, elide=True)
+        self.assertEqual([k[2] for k in output_list], [None, (0, 0), (0, 1), (1, 0)])
+
+    def test_pages(self):
+        """Test that the output is split into pages no larger than the maximum"""
+        output_list = solid_tiles(16, range(10))
+        # Room for 4 tiles on each page
+        pages = tc.export_layout(output_list, 16, True, max_pixels=16 * 16 * 4 + 100)
+        self.assertEqual([(len(tiles), rows, cols) for tiles, rows, cols in pages], [(4, 2, 2), (4, 2, 2), (2, 2, 2)])
+        self.assertEqual(output_list[5][2], (1, 0, 1))
+        self.assertEqual(output_list[9][2], (2, 0, 1))
+        # Square grids for 2 or 3 tiles have 4 cells, too many for a page of 3
+        pages = tc.export_layout(output_list, 16, True, max_pixels=16 * 16 * 3)
+        self.assertEqual([(len(tiles), rows, cols) for tiles, rows, cols in pages][0], (1, 1, 1))
+        pages = tc.export_layout(output_list, 16, True, layout="tight", max_pixels=16 * 16 * 3)
+        self.assertEqual([(len(tiles), rows, cols) for tiles, rows, cols in pages][0], (3, 1, 3))
+
+    def test_layout_saved(self):
+        """Test that layouts using more cells than a square aren't counted as saving cells"""
+        output_list = solid_tiles(16, range(10))
+        saved = tc.composite_counters["layout_saved"]
+        # 10 pages of 1 cell, against a square of 16 cells
+        tc.export_layout(output_list, 16, True, max_pixels=16 * 16)
+        self.assertEqual(tc.composite_counters["layout_saved"], saved + 6)
+        # 5 rows of 2 cells for 9 tiles, against a square of 9 cells
+        pages = tc.export_layout(output_list[:9], 16, True, max_width=32)
+        self.assertEqual([(rows, cols) for tiles, rows, cols in pages], [(5, 2)])
+        self.assertEqual(tc.composite_counters["layout_saved"], saved + 6)
+
+class export_composite(unittest.TestCase):
+    """Test building of the output image from cut images"""
+
+    def test_composite(self):
+        """Test that tiles are drawn in their cells, with masked pixels showing the background"""
+        p = 16
+        tiles = [k[0] for k in solid_tiles(p, range(5))]
+        calls = tc.composite_counters["calls"]
+        output = tc.export_composite(tiles, p, False, 3, 3)
+        self.assertEqual(output.shape, (3 * p, 3 * p, 4))
+        self.assertEqual(output[p + 1, p + 1].tolist(), [4, 10, 20, 255])
+        self.assertEqual(output[p, p].tolist(), list(config.transparent) + [255])
+        self.assertEqual(output[2 * p + 1, 1].tolist(), list(config.transparent) + [255])
+        self.assertEqual(tc.composite_counters["calls"], calls + 1)
+
+    def test_bands(self):
+        """Test that an output image written in bands is counted as one call"""
+        p = 16
+        tiles = [k[0] for k in solid_tiles(p, range(6))]
+        calls = tc.composite_counters["calls"]
+        bands = tc.composite_counters["bands"]
+        for row in range(2):
+            tc.export_composite(tiles[row * 3:(row + 1) * 3], p, False, 1, 3, band=True)
+        self.assertEqual(tc.composite_counters["calls"], calls)
+        self.assertEqual(tc.composite_counters["bands"], bands + 2)
+
+# Stand-in for makeobj, writes "pak" to the pak file for each dat file and echoes its arguments,
+# or misbehaves if asked to by the dat file
+fake_makeobj = """#!%s
+import os, sys, time
+if sys.argv[1] == "merge":
+    open(sys.argv[2], "w").write("".join([open(path).read() for path in sys.argv[3:]]))
+    print(" ".join(sys.argv[1:]))
+    sys.exit(0)
+dat = "".join([open(path).read() for path in sys.argv[3:]])
+if "sleep" in dat:
+    time.sleep(10)
+if "spam" in dat:
+    sys.stdout.write("x" * 1000000)
+print(" ".join(sys.argv[1:]))
+sys.stderr.write("warning\\n")
+if "fail" in dat:
+    sys.exit(1)
+# Given a directory, makeobj names the pak file after the object
+if os.path.isdir(sys.argv[2]):
+    sys.argv[2] = os.path.join(sys.argv[2], "building.pak")
+open(sys.argv[2], "w").write("pak" * len(sys.argv[3:]))
+"""
+
+def write_fake_makeobj(directory):
+    """Write the fake makeobj script to directory, returns its path"""
+    path = os.path.join(directory, "makeobj")
+    f = open(path, "w")
+    f.write(fake_makeobj % sys.executable)
+    f.close()
+    os.chmod(path, 0o755)
+    return path
+
+@unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+class Makeobj(unittest.TestCase):
+    """Test running of makeobj"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.makeobj = write_fake_makeobj(self.directory)
+        self.pak = os.path.join(self.directory, "out.pak")
+        self.dat = os.path.join(self.directory, "in.dat")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_makeobj(self, dat_text, timeout=None, makeobj=None):
+        f = open(self.dat, "w")
+        f.write(dat_text)
+        f.close()
+        return tc.Makeobj(makeobj or self.makeobj, timeout).pak(64, self.pak, self.dat)
+
+    def test_success(self):
+        success, output = self.run_makeobj("obj=building")
+        self.assertTrue(success)
+        self.assertEqual(output, "pak64 %s %s\nwarning\n" % (self.pak, self.dat))
+        self.assertTrue(os.path.isfile(self.pak))
+
+    def test_failure(self):
+        success, output = self.run_makeobj("fail")
+        self.assertFalse(success)
+        self.assertIn("warning", output)
+
+    def test_large_output(self):
+        success, output = self.run_makeobj("spam", timeout=30)
+        self.assertTrue(success)
+        self.assertEqual(len(output.split("\n")[0]), 1000000 + len("pak64 %s %s" % (self.pak, self.dat)))
+
+    def test_timeout(self):
+        start = time.perf_counter()
+        success, output = self.run_makeobj("sleep", timeout=0.5)
+        self.assertFalse(success)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertFalse(os.path.isfile(self.pak))
+
+    def test_missing(self):
+        success, output = self.run_makeobj("obj=building", makeobj=os.path.join(self.directory, "missing"))
+        self.assertFalse(success)
+
+@unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+class pak_files(unittest.TestCase):
+    """Test compiling several dat files with as few runs of makeobj as possible"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = mock.patch.dict(type(config).config, {"path_to_makeobj": write_fake_makeobj(self.directory)})
+        self.config.start()
+        self.pak = os.path.join(self.directory, "out.pak")
+
+    def tearDown(self):
+        self.config.stop()
+        shutil.rmtree(self.directory)
+
+    def dat(self, name, text="obj=building"):
+        path = os.path.join(self.directory, name)
+        f = open(path, "w")
+        f.write(text)
+        f.close()
+        return path
+
+    def test_one_run(self):
+        dats = [(64, self.dat("a.dat"), False), (64, self.dat("b.dat"), True)]
+        success, output = tc.pak_files(self.pak, dats)
+        self.assertTrue(success)
+        self.assertEqual(output.count("pak64"), 1)
+        self.assertEqual(open(self.pak).read(), "pakpak")
+        # Only temporary dat files are removed
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.dat", "makeobj", "out.pak"])
+
+    def test_merge_paksizes(self):
+        dats = [(64, self.dat("a.dat"), False), (32, self.dat("b.dat"), False), (64, self.dat("c.dat"), False)]
+        success, output = tc.pak_files(self.pak, dats)
+        self.assertTrue(success)
+        self.assertEqual([line.split()[0] for line in output.split("\n") if line.startswith(("pak", "merge"))], ["pak32", "pak64", "merge"])
+        self.assertEqual(open(self.pak).read(), "pak" * 3)
+        # Parts are removed once merged
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.dat", "b.dat", "c.dat", "makeobj", "out.pak"])
+
+    def test_long_command_line(self):
+        dats = [(64, self.dat("%s.dat" % n), False) for n in range(5)]
+        with mock.patch.object(tc, "max_makeobj_args", len(dats[0][1]) * 2 + 1):
+            success, output = tc.pak_files(self.pak, dats)
+        self.assertTrue(success)
+        self.assertEqual(output.count("pak64"), 3)
+        self.assertEqual(open(self.pak).read(), "pak" * 5)
+
+    def test_directory(self):
+        # Makeobj writes a pak file per object in the directory, there is nothing to merge
+        dats = [(64, self.dat("a.dat"), False), (32, self.dat("b.dat"), False)]
+        success, output = tc.pak_files(self.directory + os.sep, dats)
+        self.assertTrue(success)
+        self.assertNotIn("merge", output)
+
+    def test_failure(self):
+        dats = [(32, self.dat("a.dat", "fail"), True), (64, self.dat("b.dat"), True)]
+        success, output = tc.pak_files(self.pak, dats)
+        self.assertFalse(success)
+        self.assertEqual(output.count("pak64"), 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["makeobj"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# coding: UTF-8
+#
+# TileCutter Array Cutting Engine
+#
+# Works on RGBA arrays rather than wx objects, so can be used without wx (e.g. in CLI mode)
+# Takes the same arguments and produces the same output as the wx engine in tc
+
+import logging
+import numpy as np
+import tc
+
+# Type of source image Project.cut_images should pass to export_cutter
+image_format = "array"
+
+def multiply(a, b):
+    """Multiply two arrays of 8bit values as fractions of 255, with the same rounding cairo uses"""
+    # Cut images depend on this rounding, changing it needs tccache.tile_version increasing
+    t = a.astype(np.uint32) * b + 128
+    return ((t + (t >> 8)) >> 8).astype(np.uint8)
+
+def draw(canvas, image, x, y, transparency):
+    """Draw an RGBA image onto a canvas filled with the background colour at position x, y
+    Onto a transparent background the image is copied, otherwise it is blended by its alpha"""
+    height, width = image.shape[:2]
+    region = canvas[y:y + height, x:x + width]
+
+    if transparency:
+        region[:] = image
+        # Fully transparent pixels carry no colour
+        region[image[:, :, 3] == 0] = 0
+    else:
+        alpha = image[:, :, 3:]
+        region[:, :, :3] = multiply(image[:, :, :3], alpha) + multiply(region[:, :, :3], 255 - alpha)
+        region[:, :, 3] = 255
+
+def export_writer(project, pak_output=False, return_dat=False, write_dat=True, **options):
+    """Write a project's dat and png files
+    Other keyword arguments (e.g. dedup, elide, layout) are passed on to tc.export_output"""
+    # Runs after export_cutter has been called for all active images in the project,
+    # uses information generated by it to output files ready for makeobj compilation
+    dat_path, png_path, pak_path, dat_to_png = tc.export_paths(project)
+    logging.info("e_w: export_writer init (array engine)")
+    logging.info("e_w: Writing .png to file: %s" % png_path)
+    logging.debug("e_w: Path from .dat to .png is: %s" % dat_to_png)
+
+    return tc.export_output(project, tc.export_list(project), pak_output, return_dat, write_dat, **options)
+
+def export_cutter(source, dims, offset, p, transparency):
+    """Takes an RGBA array and dimensions, and returns an array of masked tiles
+    The output has shape (x, y, z, p, p, 4), pixels outside of each tile's mask are fully transparent"""
+    logging.info("e_c: export_cutter init (array engine)")
+    logging.debug("e_c: Passed in image of size (x, y): (%s, %s)" % (source.shape[1], source.shape[0]))
+    logging.debug("e_c: Dims (x, y, z, d): %s" % str(dims))
+    logging.debug("e_c: Offset (offx, offy): %s" % str(offset))
+    logging.debug("e_c: Transparency: %s" % str(transparency))
+
+    # To account for irregularly shaped buildings, the values of x and y dims
+    # need to be swapped where dims[3] (view#) is in [1, 3]
+    if dims[3] in [1, 3]:
+        dims = (dims[1], dims[0], dims[2])
+    else:
+        dims = (dims[0], dims[1], dims[2])
+
+    # Init mask provider
+    masks = tc.TCMasks(p)
+
+    # Source must be large enough to cut all tiles from, extend to the right and up
+    # (see tc.export_cutter)
+    height, width = source.shape[:2]
+    max_width  = max(offset[0] + (dims[0] + dims[1]) * (p // 2), width)
+    max_height = max(offset[1] + (dims[0] + dims[1]) * (p // 4) + (p // 2) + (p * (dims[2] - 1)), height)
+
+    canvas = np.empty((max_height, max_width, 4), np.uint8)
+    canvas[:] = tc.background(transparency)
+    draw(canvas, source, 0, max_height - height, transparency)
+
+    logging.info("e_c: Building output array...")
+    output_array = np.zeros((dims[0], dims[1], dims[2], p, p, 4), np.uint8)
+    for x in range(dims[0]):
+        for y in range(dims[1]):
+            for z in range(dims[2]):
+                pos = tile_to_screen((x, y, z), dims, offset, p, max_height)
+                keep = masks.mask.arrays[tc.tile_mask(x, y, z)]
+                output_array[x, y, z][keep] = canvas[pos[1]:pos[1] + p, pos[0]:pos[0] + p][keep]
+
+    logging.info("e_c: Build output array complete, exiting")
+    return output_array
+
+def tile_to_screen(pos, dims, off, p, screen_height):
+    """Integer version of tc.tile_to_screen, for use as array indices"""
+    xx, yy = tc.tile_to_screen(pos, dims, off, p, screen_height)
+    return (int(xx), int(yy))
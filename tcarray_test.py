@@ -0,0 +1,253 @@
+#!/usr/bin/python
+
+"""Unit test for tcarray.py"""
+
+import tc, tcarray, tccache, tcpng, tcstats
+import unittest
+import os, shutil, tempfile
+from unittest import mock
+import numpy as np
+
+try:
+    import wx
+except ImportError:
+    wx = None
+
+import config
+config = config.Config()
+
+
+class export_cutter(unittest.TestCase):
+    """Cut tiles are the source image seen through the mask for each tile"""
+
+    def test_single_tile(self):
+        for p in config.choicelist_paksize:
+            source = np.random.RandomState(p).randint(0, 256, (p, p, 4)).astype(np.uint8)
+            source[:, :, 3] = 255
+            cut = tcarray.export_cutter(source, (1, 1, 1, 0), (0, 0), p, True)
+            self.assertEqual(cut.shape, (1, 1, 1, p, p, 4))
+            keep = tc.TCMasks(p).mask.arrays[tc.tile_mask(0, 0, 0)]
+            self.assertTrue((cut[0, 0, 0][keep] == source[keep]).all())
+            self.assertTrue((cut[0, 0, 0][~keep] == 0).all())
+
+    def test_rotated_dims(self):
+        source = np.zeros((64, 64, 4), np.uint8)
+        self.assertEqual(tcarray.export_cutter(source, (2, 3, 2, 1), (0, 0), 32, True).shape, (3, 2, 2, 32, 32, 4))
+        self.assertEqual(tcarray.export_cutter(source, (2, 3, 2, 0), (0, 0), 32, True).shape, (2, 3, 2, 32, 32, 4))
+
+    def test_opaque_background(self):
+        # Half transparent pixels are blended onto the transparent colour when transparency is off
+        source = np.zeros((32, 32, 4), np.uint8)
+        source[:] = (255, 255, 255, 128)
+        cut = tcarray.export_cutter(source, (1, 1, 1, 0), (0, 0), 32, False)
+        expected = tcarray.multiply(np.array([255], np.uint8), np.array([128], np.uint8)) + \
+                   tcarray.multiply(np.array(config.transparent, np.uint8), np.array([127], np.uint8))
+        self.assertEqual(cut[0, 0, 0, 16, 16].tolist(), expected.tolist() + [255])
+
+    def test_multiply_rounding(self):
+        """Test that multiply rounds a * b / 255 to nearest, as cairo's (pixman's) MUL_UN8 does"""
+        a, b = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8))
+        expected = np.floor(a.astype(float) * b / 255 + 0.5)
+        self.assertTrue((tcarray.multiply(a, b) == expected).all())
+        # Values of pixman's MUL_UN8 as used by cairo, t = a * b + 128, (t + (t >> 8)) >> 8
+        pairs = [(255, 77), (128, 128), (200, 100), (1, 127), (1, 128), (231, 127)]
+        results = tcarray.multiply(np.array([p[0] for p in pairs], np.uint8), np.array([p[1] for p in pairs], np.uint8))
+        self.assertEqual(results.tolist(), [77, 64, 78, 0, 1, 115])
+
+    def test_blend_rounding(self):
+        """Test blending at partial alpha against cairo's OVER operator onto the opaque transparent colour"""
+        source = np.zeros((32, 32, 4), np.uint8)
+        source[:] = (255, 255, 255, 128)
+        source[:, 16:] = (10, 200, 90, 64)
+        with mock.patch.dict(type(config).config, {"transparent": [231, 255, 255]}):
+            cut = tcarray.export_cutter(source, (1, 1, 1, 0), (0, 0), 32, False)
+        self.assertEqual(cut[0, 0, 0, 16, 8].tolist(), [243, 255, 255, 255])
+        self.assertEqual(cut[0, 0, 0, 16, 24].tolist(), [176, 241, 214, 255])
+
+
+class CLIProject(object):
+    """Minimal project parent for use without a GUI"""
+    start_directory = os.getcwd()
+
+    def project_has_changed(self, changed=None):
+        pass
+
+
+class export_writer(unittest.TestCase):
+    """Export of a whole project with the array engine"""
+
+    def setUp(self):
+        import project
+        self.directory = tempfile.mkdtemp()
+        # Cut images aren't kept between tests
+        self.tiles = mock.patch.object(tccache, "tiles", tccache.TileCache(None, 0))
+        self.tiles.start()
+        self.project = project.Project(CLIProject())
+        self.project.save_location(os.path.join(self.directory, "test.tcp"))
+        self.project.set_all_images(os.path.abspath("test.png"))
+        self.project.directions(4)
+
+    def tearDown(self):
+        self.tiles.stop()
+        shutil.rmtree(self.directory)
+
+    def test_output(self):
+        self.project.cut_images(tcarray.export_cutter, tcarray.image_format)
+        calls = tc.composite_counters["calls"]
+        bands = tc.composite_counters["bands"]
+        dat = tcarray.export_writer(self.project, return_dat=True)
+        # One output image, written a row of tiles at a time
+        self.assertEqual(tc.composite_counters["calls"], calls + 1)
+        self.assertEqual(tc.composite_counters["bands"], bands + 2)
+        output = tcpng.read(os.path.join(self.directory, "output.png"))
+        # One tile per view for a single tile project
+        p = self.project.paksize()
+        self.assertEqual(output.shape, (2 * p, 2 * p, 4))
+        self.assertTrue("BackImage[3][0][0][0][0][0]=output.1.1" in dat)
+        f = open(os.path.join(self.directory, "output.dat"))
+        self.assertEqual(f.read(), dat)
+        f.close()
+
+    def test_pages(self):
+        self.project.cut_images(tcarray.export_cutter, tcarray.image_format)
+        p = self.project.paksize()
+        dat = tcarray.export_writer(self.project, return_dat=True, layout="tight", max_pixels=p * p * 3)
+        self.assertTrue("BackImage[3][0][0][0][0][0]=output_1.0.0" in dat)
+        self.assertEqual(tcpng.read(os.path.join(self.directory, "output_0.png")).shape, (p, 3 * p, 4))
+        self.assertEqual(tcpng.read(os.path.join(self.directory, "output_1.png")).shape, (p, p, 4))
+
+    def test_elide(self):
+        # Front images aren't set, so are empty
+        self.project.frontimage(1)
+        for d in range(4):
+            self.project.image_path(d, 0, 0, 1, "")
+        self.project.cut_images(tcarray.export_cutter, tcarray.image_format)
+        dat = tcarray.export_writer(self.project, return_dat=True, elide=True)
+        self.assertTrue("FrontImage[0][0][0][0][0][0]=-" in dat)
+        self.assertTrue("BackImage[3][0][0][0][0][0]=output.1.1" in dat)
+
+    @unittest.skipIf(wx is None, "wx not installed")
+    def test_matches_wx(self):
+        """Test that output matches the wx engine's, fully opaque and fully transparent pixels exactly, partly
+        transparent pixels to within one step in each channel (wx premultiplies alpha, which may round differently)"""
+        self.project.cut_images(tcarray.export_cutter, tcarray.image_format)
+        tcarray.export_writer(self.project)
+        array_output = tcpng.read(os.path.join(self.directory, "output.png"))
+        app = wx.App()
+        self.project.cut_images(tc.export_cutter, tc.image_format)
+        tc.export_writer(self.project)
+        wx_output = tcpng.read(os.path.join(self.directory, "output.png"))
+        # Fully opaque and fully transparent pixels are identical, partial alpha may differ by rounding
+        solid = (wx_output[:, :, 3] == 0) | (wx_output[:, :, 3] == 255)
+        self.assertTrue((array_output[solid] == wx_output[solid]).all())
+        self.assertLessEqual(np.abs(array_output.astype(int) - wx_output).max(), 1)
+
+
+class cut_images(unittest.TestCase):
+    """Cutting a project's images gives the same results with every executor"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Cut images aren't kept between tests
+        self.tiles = mock.patch.object(tccache, "tiles", tccache.TileCache(None, 0))
+        self.tiles.start()
+
+    def tearDown(self):
+        self.tiles.stop()
+        shutil.rmtree(self.directory)
+
+    def make_project(self):
+        import project
+        proj = project.Project(CLIProject())
+        proj.save_location(os.path.join(os.getcwd(), "test.tcp"))
+        proj.set_all_images("test.png")
+        proj.directions(4)
+        proj.seasons(1, season="snow")
+        proj.frontimage(1)
+        return proj
+
+    def test_executors(self):
+        proj = self.make_project()
+        proj.x(2)
+        proj.z(2)
+        results = {}
+        for executor in config.choicelist_executors:
+            proj.cut_images(tcarray.export_cutter, tcarray.image_format, executor, 2)
+            results[executor] = [proj.internals["images"][d][s][0][l].cut.tobytes() for d in range(4) for s in range(2) for l in range(2)]
+        self.assertEqual(results["serial"], results["thread"])
+        self.assertEqual(results["serial"], results["process"])
+
+    def test_incremental(self):
+        proj = self.make_project()
+        # All seasons and layers of a view use the same image, so are only cut once
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format, incremental=True), {"cut": 4, "cached": 0, "skipped": 12})
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format, incremental=True), {"cut": 0, "cached": 0, "skipped": 16})
+        proj.x_offset(2, 1, 0, 1, 5)
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format, incremental=True), {"cut": 1, "cached": 0, "skipped": 15})
+        incremental = proj.internals["images"][2][1][0][1].cut.tobytes()
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format)["cut"], 5)
+        self.assertEqual(proj.internals["images"][2][1][0][1].cut.tobytes(), incremental)
+
+    def test_disabled_slots(self):
+        proj = self.make_project()
+        proj.directions(2)
+        proj.seasons(0, season="snow")
+        proj.seasons(1, season="winter")
+        # Disabled autumn and spring use the summer image
+        self.assertEqual(proj.season_images(), [0, 0, 3, 0])
+        self.assertEqual(proj.enabled_slots(), [(d, s, 0, l) for d in range(2) for s in [0, 3] for l in range(2)])
+        # Slots which aren't output aren't loaded or cut
+        proj.cut_images(tcarray.export_cutter, tcarray.image_format)
+        self.assertFalse(proj.internals["images"][1][3][0][1].cut is None)
+        self.assertTrue(proj.internals["images"][2][0][0][0].cut is None)
+        self.assertTrue(proj.internals["images"][0][1][0][0].cut is None)
+        self.assertTrue(proj.internals["images"][0][1][0][0].source is None)
+
+    def test_shared_source(self):
+        # Even when too large for the image cache, the source image is decoded once for every slot using it
+        with mock.patch.object(tccache, "images", tccache.ImageCache(0)):
+            proj = self.make_project()
+            proj.z(2)
+            with tcstats.recording(tcstats.Report()) as report:
+                proj.cut_images(tcarray.export_cutter, tcarray.image_format)
+        self.assertEqual(report.stages["load"]["count"], 1)
+        self.assertTrue(proj.get_array(0, 0, 0, 0) is proj.get_array(3, 4, 0, 1))
+        self.assertTrue(proj.internals["images"][0][0][0][0].source is proj.internals["images"][3][4][0][1].source)
+        self.assertFalse(proj.get_array(0, 0, 0, 0).flags.writeable)
+        # Decoded images are dropped once no slot uses their file
+        old_abspath = proj.image_abspath(0, 0, 0, 0)
+        proj.set_all_images("test_1.png")
+        proj.get_array(0, 0, 0, 0)
+        self.assertEqual(list(proj.internals["sources"].keys()), [proj.image_abspath(0, 0, 0, 0)])
+        self.assertNotEqual(proj.image_abspath(0, 0, 0, 0), old_abspath)
+
+    def test_slots(self):
+        proj = self.make_project()
+        proj.x(2)
+        proj.z(2)
+        proj.cut_images(tcarray.export_cutter, tcarray.image_format)
+        p = proj.paksize()
+        # Each slot's cut images are one array, slots cut from the same inputs share it
+        slot = proj.internals["images"][1][0][0][0]
+        self.assertEqual(slot.cut.shape, (1, 2, 2, p, p, 4))
+        self.assertTrue(slot.cut is proj.internals["images"][1][1][0][1].cut)
+        self.assertTrue((proj.get_cut_image(1, 0, 0, 0, 0, 1, 1) == slot.cut[0, 1, 1]).all())
+        self.assertFalse(hasattr(slot, "__dict__"))
+
+    def test_tile_cache(self):
+        tccache.tiles.directory = self.directory
+        tccache.tiles.budget = 1 << 30
+        proj = self.make_project()
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format), {"cut": 4, "cached": 0, "skipped": 12})
+        cut = proj.internals["images"][1][0][0][0].cut.tobytes()
+        # A new project, as in a new session, reads the same images from the cache
+        proj = self.make_project()
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format), {"cut": 0, "cached": 4, "skipped": 12})
+        self.assertEqual(proj.internals["images"][1][0][0][0].cut.tobytes(), cut)
+        # Changing how an image is cut gives it a new key
+        proj.x_offset(2, 1, 0, 1, 5)
+        self.assertEqual(proj.cut_images(tcarray.export_cutter, tcarray.image_format), {"cut": 1, "cached": 4, "skipped": 11})
+
+
+if __name__ == "__main__":
+    unittest.main()
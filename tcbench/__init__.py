@@ -0,0 +1,6 @@
+# coding: UTF-8
+#
+# TileCutter Benchmarks
+#
+# Run individual benchmarks from the program directory, e.g.:
+#   python -m tcbench.masks
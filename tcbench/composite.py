@@ -0,0 +1,88 @@
+# coding: UTF-8
+#
+# TileCutter Benchmarks - Output image compositing
+#
+# Compares building the output image by drawing each cut tile with wx.GCDC.DrawBitmap
+# against the array compositor tc.export_composite, each timed as the fastest of several repeats
+
+import time
+import numpy as np
+import tc
+import config
+config = config.Config()
+
+def make_tiles(p, count, seed=0):
+    """Return an output list of count random tiles of paksize p, masked with the standard cutting masks"""
+    random = np.random.RandomState(seed)
+    keys = sorted(tc.TCMasks(p).mask.arrays)
+    output_list = []
+    for n in range(count):
+        tile = random.randint(0, 256, (p, p, 4)).astype(np.uint8)
+        tile[:, :, 3] = np.where(tc.TCMasks(p).mask.arrays[keys[n % len(keys)]], 255, 0)
+        output_list.append([tile, {}, None])
+    return output_list
+
+def legacy_composite(output_list, p, transparency):
+    """Draw wx.Bitmap tiles into the output image one at a time, as export_writer used to"""
+    side = int(np.ceil(np.sqrt(len(output_list))))
+    bgcolor = (0, 0, 0, 0) if transparency else config.transparent
+    output_bitmap = tc.wx.Bitmap(side*p, side*p)
+    outdc = tc.wx.MemoryDC()
+    outdc.SelectObject(output_bitmap)
+    gdc = tc.wx.GCDC(outdc)
+    gdc.SetBackground(tc.wx.Brush(bgcolor, tc.wx.SOLID))
+    gdc.Clear()
+    for n, k in enumerate(output_list):
+        y, x = divmod(n, side)
+        gdc.DrawBitmap(k[0], x*p, y*p, True)
+    outdc.SelectObject(tc.wx.NullBitmap)
+    return output_bitmap
+
+def to_bitmaps(output_list):
+    """Return a copy of output_list with tiles converted to wx.Bitmaps"""
+    return [[tc.wx.Bitmap.FromBufferRGBA(k[0].shape[1], k[0].shape[0], k[0].tobytes()), k[1], None] for k in output_list]
+
+def run(count=256, repeat=3):
+    """Time compositing count tiles for every paksize, returns a list of result dicts
+    Both times are the fastest of repeat runs, the legacy time is None when wx is not available"""
+    if tc.wx is not None:
+        app = tc.wx.App()
+
+    results = []
+    for p in config.choicelist_paksize:
+        output_list = make_tiles(p, count)
+        tiles = [k[0] for k in output_list]
+        rows, cols = tc.export_shape(count, p)
+        # Fastest of the repeats, the same statistic as the legacy time
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            tc.export_composite(tiles, p, True, rows, cols)
+            times.append(time.perf_counter() - start)
+        arrays = min(times)
+
+        legacy = None
+        if tc.wx is not None:
+            bitmaps = to_bitmaps(output_list)
+            times = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                legacy_composite(bitmaps, p, True)
+                times.append(time.perf_counter() - start)
+            legacy = min(times)
+
+        results.append({"paksize": p, "tiles": count, "legacy": legacy, "arrays": arrays})
+    return results
+
+def main():
+    if tc.wx is None:
+        print("wx not available, only timing the array compositor")
+    print("%8s %8s %12s %12s %9s" % ("paksize", "tiles", "gcdc (ms)", "arrays (ms)", "speedup"))
+    for r in run():
+        if r["legacy"] is None:
+            print("%8s %8s %12s %12.2f %9s" % (r["paksize"], r["tiles"], "-", r["arrays"] * 1000, "-"))
+        else:
+            print("%8s %8s %12.2f %12.2f %8.1fx" % (r["paksize"], r["tiles"], r["legacy"] * 1000, r["arrays"] * 1000, r["legacy"] / r["arrays"]))
+
+if __name__ == "__main__":
+    main()
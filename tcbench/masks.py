@@ -0,0 +1,133 @@
+# coding: UTF-8
+#
+# TileCutter Benchmarks - Cutting mask generation
+#
+# Compares building a TCMaskSet with the old per-pixel SetRGB loops against
+# the array based TCMaskSet, for every paksize in config.choicelist_paksize
+
+import time
+import tc
+import config
+config = config.Config()
+
+class PixelBuffer(object):
+    """Stand-in for wx.Image when wx isn't available, with the same per-pixel SetRGB interface"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.data = bytearray(width * height * 3)
+
+    def GetWidth(self):
+        return self.width
+
+    def SetRGB(self, x, y, r, g, b):
+        i = (y * self.width + x) * 3
+        self.data[i:i + 3] = bytes((r, g, b))
+
+class LegacyMaskSet(object):
+    """The per-pixel mask generation TCMaskSet used before masks were built as arrays"""
+
+    def __init__(self, p, image_type):
+        self.image_type = image_type
+        self.masks = {}
+        for key, fills in [(-1, [self.fill_left, self.fill_right]),
+                           (0, [self.fill_bottom_triangles, self.fill_top_left, self.fill_top_right]),
+                           (1, [self.fill_bottom_triangles, self.fill_top_left]),
+                           (2, [self.fill_bottom_triangles, self.fill_top_right]),
+                           (3, [self.fill_bottom_triangles]),
+                           (4, [self.fill_left]),
+                           (5, [self.fill_right]),
+                           (6, [])]:
+            a = self.init_new_mask(p)
+            for fill in fills:
+                fill(a)
+            if tc.wx is not None:
+                self.masks[key] = tc.wx.Bitmap(a, 1)
+            else:
+                self.masks[key] = a
+
+    def init_new_mask(self, paksize):
+        mask = self.image_type(paksize, paksize)
+        for i in range(paksize):
+            for j in range(paksize):
+                mask.SetRGB(i, j, 255, 255, 255)
+        return mask
+
+    def fill_bottom_triangles(self, mask):
+        paksize = mask.GetWidth()
+        half = paksize >> 1
+        fourth = paksize >> 2
+        for y in range(0, fourth):
+            for x in range(0, y << 1):
+                mask.SetRGB(x, half + fourth + y, 0, 0, 0)
+        for y in range(0, fourth):
+            for x in range(paksize - (y << 1), paksize):
+                mask.SetRGB(x, half + fourth + y, 0, 0, 0)
+
+    def fill_left(self, mask):
+        paksize = mask.GetWidth()
+        for y in range(0, paksize):
+            for x in range(0, paksize >> 1):
+                mask.SetRGB(x, y, 0, 0, 0)
+
+    def fill_right(self, mask):
+        paksize = mask.GetWidth()
+        for y in range(0, paksize):
+            for x in range(paksize >> 1, paksize):
+                mask.SetRGB(x, y, 0, 0, 0)
+
+    def fill_top_left(self, mask):
+        paksize = mask.GetWidth()
+        half = paksize >> 1
+        fourth = paksize >> 2
+        for y in range(0, fourth):
+            for x in range(0, y << 1):
+                mask.SetRGB(x, half + fourth - y, 0, 0, 0)
+        for y in range(0, half + 1):
+            for x in range(0, half):
+                mask.SetRGB(x, y, 0, 0, 0)
+
+    def fill_top_right(self, mask):
+        paksize = mask.GetWidth()
+        half = paksize >> 1
+        fourth = paksize >> 2
+        for y in range(0, fourth):
+            for x in range(paksize - (y << 1), paksize):
+                mask.SetRGB(x, half + fourth - y, 0, 0, 0)
+        for y in range(0, half + 1):
+            for x in range(half, paksize):
+                mask.SetRGB(x, y, 0, 0, 0)
+
+def best_time(function, repeat):
+    """Return the fastest of repeat runs of function, in seconds"""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def run(repeat=3):
+    """Time old and new mask generation for every paksize, returns a list of result dicts"""
+    if tc.wx is not None:
+        app = tc.wx.App()
+        image_type = tc.wx.Image
+    else:
+        image_type = PixelBuffer
+
+    results = []
+    for p in config.choicelist_paksize:
+        legacy = best_time(lambda: LegacyMaskSet(p, image_type), repeat)
+        arrays = best_time(lambda: tc.TCMaskSet(p), repeat)
+        results.append({"paksize": p, "legacy": legacy, "arrays": arrays})
+    return results
+
+def main():
+    if tc.wx is None:
+        print("wx not available, legacy masks are built with SetRGB on a Python buffer")
+    print("%8s %12s %12s %9s" % ("paksize", "legacy (ms)", "arrays (ms)", "speedup"))
+    for r in run():
+        print("%8s %12.2f %12.3f %8.0fx" % (r["paksize"], r["legacy"] * 1000, r["arrays"] * 1000, r["legacy"] / r["arrays"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# coding: UTF-8
+#
+# TileCutter Benchmarks - Output image encoding
+#
+# Compares peak memory and throughput of building the whole output image in memory
+# and encoding it at once, against compositing and encoding it a row of images at a time.
+# Each run happens in a fresh process so that its peak RSS can be measured
+
+import multiprocessing, os, resource, sys, tempfile, time
+import numpy as np
+import tc, tcpng
+import config
+config = config.Config()
+
+def make_tiles(p, count):
+    """Return a list of count tiles of paksize p, all sharing one array so that the input uses little memory"""
+    tile = np.random.RandomState(0).randint(0, 256, (p, p, 4)).astype(np.uint8)
+    tile[:, :, 3] = np.where(tc.TCMasks(p).mask.arrays[0], 255, 0)
+    return [tile] * count
+
+def whole_image(tiles, p, path):
+    """Composite the whole output image, then encode it"""
+    rows, cols = tc.export_shape(len(tiles), p)
+    tcpng.write(path, tc.export_composite(tiles, p, True, rows, cols))
+
+def row_bands(tiles, p, path):
+    """Composite and encode the output image one row of images at a time, as export_output does"""
+    rows, cols = tc.export_shape(len(tiles), p)
+    f = open(path, "wb")
+    writer = tcpng.Writer(f, cols * p, rows * p, 4)
+    for row in range(rows):
+        writer.write(tc.export_composite(tiles[row * cols:(row + 1) * cols], p, True, 1, cols))
+    writer.close()
+    f.close()
+
+def peak_rss():
+    """Return peak resident set size of this process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on OSX, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+def measure(method, p, count, queue):
+    """Run method in this (child) process, report time taken and peak RSS above the starting RSS"""
+    tiles = make_tiles(p, count)
+    handle, path = tempfile.mkstemp(suffix=".png")
+    os.close(handle)
+    before = peak_rss()
+    start = time.perf_counter()
+    globals()[method](tiles, p, path)
+    seconds = time.perf_counter() - start
+    os.remove(path)
+    queue.put((seconds, peak_rss() - before))
+
+def run_one(method, p, count):
+    """Return (seconds, peak RSS increase in bytes) of method, run in a fresh process"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(method, p, count, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def run(sizes=[(64, 4096), (128, 2048), (240, 1024)]):
+    """Time and measure both methods for each (paksize, number of tiles) in sizes, returns a list of result dicts"""
+    results = []
+    for p, count in sizes:
+        rows, cols = tc.export_shape(count, p)
+        megapixels = rows * cols * p * p / 1000000.0
+        for method in ["whole_image", "row_bands"]:
+            seconds, rss = run_one(method, p, count)
+            results.append({"method": method, "paksize": p, "tiles": count, "megapixels": megapixels,
+                            "seconds": seconds, "peak_rss": rss, "throughput": megapixels / seconds})
+    return results
+
+def main():
+    print("%12s %8s %8s %10s %10s %14s %14s" % ("method", "paksize", "tiles", "megapixels", "time (s)", "peak RSS (MB)", "MPixels/s"))
+    for r in run():
+        print("%12s %8s %8s %10.1f %10.2f %14.1f %14.1f" % (r["method"], r["paksize"], r["tiles"], r["megapixels"],
+                                                           r["seconds"], r["peak_rss"] / 1048576.0, r["throughput"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# coding: UTF-8
+#
+# TileCutter Benchmarks - Cutting engine suite
+#
+# Generates synthetic source images and projects across paksizes, dims, views, seasons and
+# layers, then times each stage of an export separately. Uses the array engine, so runs without wx
+#
+# Results can be written as JSON for comparison between commits, e.g.:
+#   python -m tcbench.suite -o before.json
+#   python -m tcbench.suite -p 64,240 -d 1,4,16 -o after.json
+
+import io, json, os, platform, shutil, subprocess, sys, tempfile, time
+from optparse import OptionParser
+import numpy as np
+import tc, tcarray, tccache, tccli, tcpng, project
+import config
+config = config.Config()
+
+# Each axis of the benchmark matrix, "quick" is the default
+presets = {
+    "quick": {
+        "paksizes": [32, 128],
+        "dims": [1, 4],
+        "views": [1, 4],
+        "seasons": [1, 5],
+        "layers": [1, 2],
+    },
+    "full": {
+        "paksizes": config.choicelist_paksize,
+        "dims": [1, 2, 4, 8, 16],
+        "views": config.choicelist_views,
+        "seasons": [1, 2, 4, 5],
+        "layers": [1, 2],
+    },
+}
+
+# Seasons enabled in a project for each number of seasons output
+season_flags = {
+    1: {"snow": 0, "autumn": 0, "winter": 0, "spring": 0},
+    2: {"snow": 1, "autumn": 0, "winter": 0, "spring": 0},
+    4: {"snow": 0, "autumn": 1, "winter": 1, "spring": 1},
+    5: {"snow": 1, "autumn": 1, "winter": 1, "spring": 1},
+}
+
+def source_size(p, dims):
+    """Return the (width, height) of a source image which exactly covers a building of dims (x, y, z)"""
+    x, y, z = dims
+    return ((x + y) * (p // 2), (x + y) * (p // 4) + (p // 2) + p * (z - 1))
+
+def make_source(path, p, dims, seed=0):
+    """Write a random RGBA source image for a building of dims (x, y, z) to path"""
+    width, height = source_size(p, dims)
+    random = np.random.RandomState(seed)
+    image = random.randint(0, 256, (height, width, 4)).astype(np.uint8)
+    # Mix of fully transparent, partly transparent and opaque pixels
+    image[:, :, 3] = random.choice([0, 128, 255, 255], (height, width))
+    tcpng.write(path, image)
+
+def make_project(directory, source, p, dims, views, seasons, layers):
+    """Return a new project using source for all images, saved in directory"""
+    proj = project.Project(tccli.CLIApp())
+    proj.save_location(os.path.join(directory, "bench.tcp"))
+    proj.paksize(p)
+    proj.x(dims[0])
+    proj.y(dims[1])
+    proj.z(dims[2])
+    proj.directions(views)
+    for season, flag in season_flags[seasons].items():
+        proj.seasons(flag, season=season)
+    proj.frontimage(layers - 1)
+    proj.set_all_images(source)
+    return proj
+
+def cut_bytes(p, dims, views):
+    """Estimate the memory used by cut images, each view's images are cut once"""
+    return views * dims[0] * dims[1] * dims[2] * p * p * 4
+
+def slot_bytes(proj):
+    """Return the bytes of source and cut image arrays held by proj's image slots, counting shared arrays once"""
+    arrays = {}
+    for direction in proj.internals["images"]:
+        for season in direction:
+            for frame in season:
+                for slot in frame:
+                    for array in [slot.source, slot.cut]:
+                        if array is not None:
+                            arrays[id(array)] = array.nbytes
+    return sum(arrays.values())
+
+def time_stages(proj, source):
+    """Export proj once, returns a dict of seconds taken by each stage, plus output statistics"""
+    p = proj.paksize()
+    transparency = proj.transparency()
+    stages = {}
+
+    start = time.perf_counter()
+    tc.TCMaskSet(p)
+    stages["mask"] = time.perf_counter() - start
+
+    tccache.images.invalidate()
+    start = time.perf_counter()
+    tccache.images.get(source, "array", project.read_array)
+    stages["load"] = time.perf_counter() - start
+
+    # Source image is now cached, so cutting doesn't include decoding it
+    start = time.perf_counter()
+    proj.cut_images(tcarray.export_cutter, tcarray.image_format)
+    stages["cut"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output_list = tc.export_list(proj)
+    pages = tc.export_layout(output_list, p, transparency)
+    bands = []
+    for tiles, rows, cols in pages:
+        for row in range(rows):
+            bands.append(tc.export_composite(tiles[row * cols:(row + 1) * cols], p, transparency, 1, cols))
+    stages["composite"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    f = io.BytesIO()
+    tiles, rows, cols = pages[0]
+    writer = tcpng.Writer(f, cols * p, rows * p, 4)
+    for band in bands:
+        writer.write(band)
+    writer.close()
+    stages["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tc.export_dat(proj, output_list, "bench")
+    stages["dat"] = time.perf_counter() - start
+
+    return stages, {"tiles": len(output_list), "output_pixels": rows * cols * p * p, "png_bytes": len(f.getvalue()),
+                    "slot_bytes": slot_bytes(proj)}
+
+def git_commit():
+    """Return the current git commit of the program directory, or None if not available"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(tc.__file__)),
+                                       stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(axes, repeat=1, max_cut_bytes=1 << 30, report=None):
+    """Run every combination of the values in axes, returns the results as a dict ready for JSON output
+    Cases needing more than max_cut_bytes of cut images are skipped, report is called with each case's result"""
+    directory = tempfile.mkdtemp()
+    # Every case is cut from scratch, cut images from the tile cache would only time reading them
+    tiles = tccache.tiles
+    tccache.tiles = tccache.TileCache(None, 0)
+    results = {
+        "version": config.version,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "cases": [],
+    }
+    try:
+        for p in axes["paksizes"]:
+            for d in axes["dims"]:
+                dims = (d, d, d)
+                source = os.path.join(directory, "source_%s_%s.png" % (p, d))
+                for views in axes["views"]:
+                    for seasons in axes["seasons"]:
+                        for layers in axes["layers"]:
+                            case = {"paksize": p, "dims": list(dims), "views": views, "seasons": seasons, "layers": layers}
+                            if cut_bytes(p, dims, views) > max_cut_bytes:
+                                case["skipped"] = True
+                            else:
+                                if not os.path.exists(source):
+                                    make_source(source, p, dims)
+                                proj = make_project(directory, source, p, dims, views, seasons, layers)
+                                best = None
+                                for i in range(repeat):
+                                    stages, stats = time_stages(proj, source)
+                                    if best is None:
+                                        best = stages
+                                    else:
+                                        best = dict([(k, min(best[k], stages[k])) for k in best])
+                                case["stages"] = best
+                                case.update(stats)
+                            results["cases"].append(case)
+                            if report is not None:
+                                report(case)
+    finally:
+        tccache.images.invalidate()
+        tccache.tiles = tiles
+        shutil.rmtree(directory)
+    return results
+
+stage_names = ["mask", "load", "cut", "composite", "encode", "dat"]
+
+def print_case(case):
+    """Print one line of the results table"""
+    name = "%s %sx%sx%s v%s s%s l%s" % (case["paksize"], case["dims"][0], case["dims"][1], case["dims"][2],
+                                        case["views"], case["seasons"], case["layers"])
+    if case.get("skipped"):
+        print("%-24s skipped, cut images too large" % name)
+    else:
+        print("%-24s %7s" % (name, case["tiles"]) + "".join([" %10.2f" % (case["stages"][s] * 1000) for s in stage_names]) +
+              " %10.2f" % (case["slot_bytes"] / 1048576.0))
+    sys.stdout.flush()
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+def main():
+    parser = OptionParser(usage="usage: python -m tcbench.suite [options]")
+    parser.add_option("--preset", type="choice", choices=list(presets.keys()), default="quick",
+                      help="set of values for each axis, \"quick\" (default) or \"full\"")
+    parser.add_option("-p", dest="paksizes", help="comma separated list of paksizes, overrides preset", metavar="LIST")
+    parser.add_option("-d", dest="dims", help="comma separated list of cube dims (e.g. 4 for 4x4x4), overrides preset", metavar="LIST")
+    parser.add_option("-v", dest="views", help="comma separated list of numbers of views, overrides preset", metavar="LIST")
+    parser.add_option("-s", dest="seasons", help="comma separated list of numbers of seasons (1, 2, 4 or 5), overrides preset", metavar="LIST")
+    parser.add_option("-l", dest="layers", help="comma separated list of numbers of layers (1 or 2), overrides preset", metavar="LIST")
+    parser.add_option("-r", dest="repeat", type="int", default=1, help="run each case REPEAT times, keeping the fastest time for each stage", metavar="REPEAT")
+    parser.add_option("-m", dest="max_megabytes", type="int", default=1024, help="skip cases with more than MB of cut images (default 1024)", metavar="MB")
+    parser.add_option("-o", dest="output", help="write JSON results to FILE", metavar="FILE")
+    options, args = parser.parse_args()
+
+    axes = dict(presets[options.preset])
+    for axis in axes:
+        if getattr(options, axis) is not None:
+            axes[axis] = int_list(getattr(options, axis))
+
+    print("%-24s %7s" % ("case", "tiles") + "".join([" %10s" % ("%s (ms)" % s) for s in stage_names]) + " %10s" % "slots (MB)")
+    results = run(axes, options.repeat, options.max_megabytes << 20, print_case)
+
+    if options.output is not None:
+        f = open(options.output, "w")
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.close()
+        print("Results written to: %s" % options.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# coding: UTF-8
+#
+# TileCutter Caches
+#
+# Decoded source images are shared by all slots and projects in the process
+# Cut images are kept on disk between runs, and can be shared by several processes or machines
+
+import hashlib, logging, os, tempfile, threading
+from collections import OrderedDict
+import numpy as np
+import config
+config = config.Config()
+
+# Version of the cut images stored in the tile cache, part of every key. Must be increased whenever the cutting
+# engines give different cut images for the same inputs (e.g. changes to export_cutter, tc.tile_mask, the masks
+# or tcarray.multiply's rounding), as the fingerprint only covers the inputs, not the code
+tile_version = 1
+
+# Trimming the tile cache lists every file in it, so it is only trimmed once this fraction of its budget
+# has been put since it was last trimmed
+trim_fraction = 0.1
+
+class ImageCache(object):
+    """LRU cache of decoded images, keyed by absolute path, file modification time and size
+    Several kinds of decoded image (e.g. "array", "image", "bitmap") can be cached for each file,
+    as well as the "hash" of its contents"""
+
+    def __init__(self, budget):
+        # Maximum total size of cached images in bytes
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, abspath, kind, load):
+        """Return the decoded image of the specified kind for the file at abspath
+        If not cached, load(abspath) is called to decode it, and the result is cached"""
+        try:
+            stat = os.stat(abspath)
+        except OSError:
+            # Nothing to key a missing file on, so don't cache it
+            return load(abspath)
+        key = (abspath, stat.st_mtime_ns, stat.st_size, kind)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        value = load(abspath)
+        size = image_size(value)
+
+        with self.lock:
+            # Any entries for an older version of the file will never be used again
+            for old in [k for k in self.entries if k[0] == abspath and k[3] == kind]:
+                self.remove(old)
+            if size <= self.budget:
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.budget:
+                    self.remove(next(iter(self.entries)))
+        return value
+
+    def invalidate(self, abspath=None):
+        """Remove all cached images of the file at abspath, or all cached images if no path is given"""
+        with self.lock:
+            for key in [k for k in self.entries if abspath is None or k[0] == abspath]:
+                self.remove(key)
+        logging.debug("tccache: invalidate - path: %s, cache now %s bytes" % (abspath, self.size))
+
+    def remove(self, key):
+        """Remove an entry, the lock must be held by the caller"""
+        value, size = self.entries.pop(key)
+        self.size -= size
+
+def image_size(value):
+    """Return the approximate size in bytes of a decoded image"""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    elif isinstance(value, str):
+        # File content hashes
+        return len(value)
+    else:
+        # wx.Image or wx.Bitmap, assume 4 bytes per pixel
+        return value.GetWidth() * value.GetHeight() * 4
+
+class TileCache(object):
+    """Directory of cut images, each an uncompressed .npy file of RGBA values which is memory mapped when read
+    Keyed by a hash of everything the cut images depend on (see Project.cut_fingerprint) and tile_version, so entries
+    are never stale and the directory can be shared. Least recently used files are deleted to keep it below budget bytes"""
+
+    def __init__(self, directory, budget):
+        # No directory, or a budget of 0, disables the cache
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        # Bytes put since the cache was last trimmed
+        self.put_bytes = 0
+        # If False trim_if_needed does nothing, for callers which trim once themselves (e.g. tccli.run)
+        self.auto_trim = True
+        self.lock = threading.Lock()
+
+    def enabled(self):
+        return bool(self.directory) and self.budget > 0
+
+    def key(self, fingerprint):
+        """Return the key of the cut images for fingerprint, a tuple of strings, numbers and tuples"""
+        return hashlib.sha1(repr((tile_version, fingerprint)).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        # Split between subdirectories, to keep each one small
+        return os.path.join(self.directory, key[:2], "%s.npy" % key)
+
+    def get(self, key):
+        """Return the cached array for key as a read only memory map, or None if not cached"""
+        if not self.enabled():
+            return None
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            # Modification time is when the file was last used, for finding the least recently used file
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, or left incomplete by another process
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """Store array for key, written to a temporary file first so other processes never read part of it"""
+        if not self.enabled() or array.nbytes > self.budget:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.split(path)[0], exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.split(path)[0])
+            f = os.fdopen(handle, "wb")
+            try:
+                np.save(f, np.ascontiguousarray(array))
+                f.close()
+                os.replace(temp_path, path)
+                with self.lock:
+                    self.put_bytes += array.nbytes
+            except BaseException:
+                f.close()
+                os.remove(temp_path)
+                raise
+        except OSError:
+            logging.warn("tccache: put - unable to write to tile cache: %s" % self.directory)
+
+    def files(self):
+        """Return a list of (last used, size, path) of the files in the cache"""
+        found = []
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".npy"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime_ns, stat.st_size, path))
+        return found
+
+    def trim_if_needed(self):
+        """Trim the cache if more than trim_fraction of its budget has been put since it was last trimmed"""
+        if self.auto_trim and self.put_bytes > self.budget * trim_fraction:
+            self.trim()
+
+    def trim(self):
+        """Delete the least recently used files until the cache is within its budget"""
+        with self.lock:
+            self.put_bytes = 0
+        if not self.enabled() or not os.path.isdir(self.directory):
+            return
+        found = sorted(self.files())
+        size = sum([f[1] for f in found])
+        for mtime, file_size, path in found:
+            if size <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped (on Windows), or already removed by another process
+                continue
+            size -= file_size
+        logging.debug("tccache: trim - tile cache now %s bytes" % size)
+
+def tile_directory():
+    """Return the directory of the tile cache, from the config or in the program's settings directory by default"""
+    return config.tile_cache_directory or os.path.join(config.main_path, "cache")
+
+# Shared by all projects
+images = ImageCache(config.image_cache_size)
+tiles = TileCache(tile_directory(), config.tile_cache_size)
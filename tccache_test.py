@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+"""Unit test for tccache.py"""
+
+import tccache
+import unittest
+import os, shutil, tempfile
+from unittest import mock
+import numpy as np
+
+
+class ImageCache(unittest.TestCase):
+    """Test caching of decoded images"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.loads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        f = open(path, "wb")
+        f.write(data)
+        f.close()
+        return path
+
+    def load(self, abspath):
+        """Stand-in decoder, 100 bytes per image"""
+        self.loads.append(abspath)
+        return np.zeros(100, np.uint8)
+
+    def test_hit(self):
+        cache = tccache.ImageCache(1000)
+        path = self.write("a.png", b"a")
+        first = cache.get(path, "array", self.load)
+        self.assertTrue(cache.get(path, "array", self.load) is first)
+        self.assertEqual(len(self.loads), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Other kinds of image are cached separately
+        cache.get(path, "image", self.load)
+        self.assertEqual(len(self.loads), 2)
+
+    def test_file_changed(self):
+        cache = tccache.ImageCache(1000)
+        path = self.write("a.png", b"a")
+        cache.get(path, "array", self.load)
+        os.utime(path, ns=(0, 0))
+        cache.get(path, "array", self.load)
+        self.assertEqual(len(self.loads), 2)
+        # The entry for the old version of the file is dropped
+        self.assertEqual(cache.size, 100)
+
+    def test_budget(self):
+        cache = tccache.ImageCache(250)
+        paths = [self.write("%s.png" % n, b"a") for n in range(3)]
+        cache.get(paths[0], "array", self.load)
+        cache.get(paths[1], "array", self.load)
+        cache.get(paths[0], "array", self.load)
+        cache.get(paths[2], "array", self.load)
+        # Least recently used image is evicted
+        self.assertEqual(cache.size, 200)
+        cache.get(paths[0], "array", self.load)
+        cache.get(paths[1], "array", self.load)
+        self.assertEqual(self.loads, [paths[0], paths[1], paths[2], paths[1]])
+
+    def test_invalidate(self):
+        cache = tccache.ImageCache(1000)
+        path = self.write("a.png", b"a")
+        other = self.write("b.png", b"b")
+        cache.get(path, "array", self.load)
+        cache.get(other, "array", self.load)
+        cache.invalidate(path)
+        cache.get(path, "array", self.load)
+        cache.get(other, "array", self.load)
+        self.assertEqual(len(self.loads), 3)
+        cache.invalidate()
+        self.assertEqual(cache.size, 0)
+
+    def test_missing_file(self):
+        cache = tccache.ImageCache(1000)
+        path = os.path.join(self.directory, "missing.png")
+        cache.get(path, "array", self.load)
+        cache.get(path, "array", self.load)
+        self.assertEqual(len(self.loads), 2)
+        self.assertEqual(cache.size, 0)
+
+
+
+class TileCache(unittest.TestCase):
+    """Test keeping cut images on disk"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get(self):
+        cache = tccache.TileCache(self.directory, 1000)
+        key = cache.key(("hash", (1, 1, 1, 0), (0, 0), 64, True))
+        self.assertEqual(cache.get(key), None)
+        cache.put(key, np.arange(24, dtype=np.uint8).reshape(1, 1, 1, 2, 3, 4))
+        tiles = cache.get(key)
+        self.assertEqual(tiles.shape, (1, 1, 1, 2, 3, 4))
+        self.assertEqual(tiles.tolist(), np.arange(24).reshape(1, 1, 1, 2, 3, 4).tolist())
+        # Memory mapped, not read in, and never written to
+        self.assertTrue(isinstance(tiles, np.memmap))
+        self.assertFalse(tiles.flags.writeable)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Only the cached file is left in the directory, no temporary files
+        self.assertEqual([os.path.basename(f[2]) for f in cache.files()], ["%s.npy" % key])
+
+    def test_key(self):
+        cache = tccache.TileCache(self.directory, 1000)
+        self.assertEqual(cache.key(("hash", 64)), cache.key(("hash", 64)))
+        self.assertNotEqual(cache.key(("hash", 64)), cache.key(("hash", 32)))
+        # Tiles cut by a different version of the cutting code aren't used
+        key = cache.key(("hash", 64))
+        with mock.patch.object(tccache, "tile_version", tccache.tile_version + 1):
+            self.assertNotEqual(cache.key(("hash", 64)), key)
+
+    def test_trim(self):
+        # Room for two of the three arrays, with their .npy headers
+        cache = tccache.TileCache(self.directory, 2 * (100 + 128))
+        keys = [cache.key(n) for n in range(3)]
+        for n, key in enumerate(keys):
+            cache.put(key, np.zeros(100, np.uint8))
+            os.utime(cache.path(key), ns=(n * 10 ** 9, n * 10 ** 9))
+        # Using the oldest file makes it the most recently used
+        cache.get(keys[0])
+        cache.trim()
+        self.assertFalse(cache.get(keys[0]) is None)
+        self.assertTrue(cache.get(keys[1]) is None)
+        self.assertFalse(cache.get(keys[2]) is None)
+
+    def test_trim_if_needed(self):
+        cache = tccache.TileCache(self.directory, 10000)
+        cache.put(cache.key(0), np.zeros(500, np.uint8))
+        with mock.patch.object(cache, "trim") as trim:
+            # Less than a tenth of the budget put since the last trim
+            cache.trim_if_needed()
+            self.assertEqual(trim.call_count, 0)
+            cache.put(cache.key(1), np.zeros(600, np.uint8))
+            cache.trim_if_needed()
+            self.assertEqual(trim.call_count, 1)
+        cache.trim()
+        self.assertEqual(cache.put_bytes, 0)
+        cache.put(cache.key(2), np.zeros(2000, np.uint8))
+        cache.auto_trim = False
+        with mock.patch.object(cache, "trim") as trim:
+            cache.trim_if_needed()
+            self.assertEqual(trim.call_count, 0)
+
+    def test_disabled(self):
+        for cache in [tccache.TileCache(None, 1000), tccache.TileCache(self.directory, 0)]:
+            cache.put("key", np.zeros(100, np.uint8))
+            self.assertEqual(cache.get("key"), None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+# coding: UTF-8
+#
+# TileCutter Command Line Interface
+#
+# Exports projects without a GUI, using the array cutting engine so that wx is not needed
+
+import json, logging, os, sys, time, traceback
+import concurrent.futures
+from collections import OrderedDict
+
+import config
+config = config.Config()
+
+import tc, tcarray, tccache, tcstats
+# Classes to read/write TileCutter files
+from tcp import tcp_reader
+
+class CLIApp(object):
+    """Stand-in for the GUI application, provides what projects need from their parent"""
+
+    def __init__(self):
+        self.gui = False
+        self.start_directory = os.getcwd()
+        self.activeproject = None
+
+    def project_has_changed(self, changed=None):
+        """Nothing to update without a GUI"""
+        pass
+
+    def load_project(self, location):
+        """Load a project based on a file location"""
+        logging.info("CLIApp: load_project - Load project from file: %s" % location)
+
+        # Output paths are relative to the project's location, so it must be absolute
+        t_reader = tcp_reader(os.path.abspath(location))
+
+        # Load project, passing reference to self which will be set as project's parent
+        project = t_reader.load([self,])
+
+        if project == False:
+            logging.error("CLIApp: load_project - ERROR: load_project - Loading failed!")
+            return False
+
+        self.activeproject = project
+        logging.info("CLIApp: load_project - Load Project succeeded")
+        return True
+
+    def export_project(self, project, pak_output=False, return_dat=None, write_dat=None, **writer_options):
+        """Trigger exporting of specified project
+        Other keyword arguments (e.g. dedup, elide, layout) are passed on to the export writer
+        Returns a tcstats.Report of the time taken by each stage of the export"""
+        if return_dat is None:
+            return_dat = not config.write_dat
+
+        if write_dat is None:
+            write_dat = config.write_dat
+
+        with tcstats.recording(tcstats.Report()) as report:
+            # First trigger project to generate cut images
+            # Each export loads its project afresh, so there are no images cut earlier for incremental cutting
+            # to skip (that is only done within a GUI session), images cut by earlier runs come from the tile cache
+            counts = project.cut_images(tcarray.export_cutter, tcarray.image_format)
+            logging.info("CLIApp: export_project - images cut: %(cut)s, from tile cache: %(cached)s, skipped: %(skipped)s" % counts)
+
+            # Then feed project into outputting routine
+            tcarray.export_writer(project, pak_output, return_dat, write_dat, **writer_options)
+
+        logging.info("CLIApp: export_project - export took %s" % report.summary())
+        return report
+
+def expand_paths(args):
+    """Return the list of files to process for the command line arguments args
+    Directories are searched recursively for .tcp files, other arguments are used as they are"""
+    files = []
+    for arg in args:
+        if os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                # Walk directories in a consistent order so output order doesn't depend on the filesystem
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() == ".tcp":
+                        files.append(os.path.join(dirpath, filename))
+        else:
+            files.append(arg)
+    return files
+
+def export_file(options, file, defer_pak=False):
+    """Load and export a single project file, with any output overrides from options applied
+    Returns a tuple of (file, success, time taken in seconds, export report as a dict or None if export failed, pak)
+    If defer_pak is True makeobj isn't run, pak is the arguments for tc.pak_file to compile the .pak file later,
+    otherwise (or if no .pak file is needed) pak is None"""
+    start = time.perf_counter()
+    # Set here rather than by run, as this may be in a worker process
+    if options.cache_dir is not None:
+        tccache.tiles.directory = os.path.abspath(options.cache_dir)
+    # The tile cache is trimmed once by run after all projects are exported, not by each one
+    tccache.tiles.auto_trim = False
+    # Each file gets its own app and project, so several can be exported at once
+    app = CLIApp()
+
+    if options.verbose is not False:
+        logging.info("processing file: %s" % file)
+    # Try to load in project, if this fails skip this filename and print an error
+    if not app.load_project(file):
+        if options.verbose is not False:
+            logging.warn("loading file failed, skipping: %s" % file)
+        return (file, False, time.perf_counter() - start, None, None)
+
+    if options.verbose is not False:
+        logging.info("loaded file, preparing to export")
+    project = app.activeproject
+
+    # Apply any command line overrides specified by user
+    # For PNG file
+    if options.png_directory is not None:
+        png_dir = options.png_directory
+    else:
+        png_dir = os.path.split(project.pngfile_location())[0]
+
+    if options.png_filename is not None:
+        png_file = options.png_filename
+    else:
+        png_file = os.path.split(project.pngfile_location())[1]
+
+    project.pngfile_location(os.path.join(png_dir, png_file))
+    # For DAT file
+    if options.dat_directory is not None:
+        dat_dir = options.dat_directory
+    else:
+        dat_dir = os.path.split(project.datfile_location())[0]
+
+    if options.dat_filename is not None:
+        dat_file = options.dat_filename
+    else:
+        dat_file = os.path.split(project.datfile_location())[1]
+
+    project.datfile_location(os.path.join(dat_dir, dat_file))
+    # For PAK file
+    if options.pak_directory is not None:
+        pak_dir = options.pak_directory
+    else:
+        pak_dir = os.path.split(project.pakfile_location())[0]
+    if options.pak_filename is not None:
+        pak_file = options.pak_filename
+    else:
+        pak_file = os.path.split(project.pakfile_location())[1]
+    project.pakfile_location(os.path.join(pak_dir, pak_file))
+
+    paks = []
+    if defer_pak:
+        writer_options = {"makeobj": lambda *pak: paks.append(pak)}
+    else:
+        writer_options = {}
+    try:
+        report = app.export_project(project, pak_output=options.pak_output, return_dat=False, write_dat=options.dat_output,
+                           dedup=options.dedup, elide=options.elide, layout=options.layout, max_width=options.max_width,
+                           max_pixels=options.max_pixels, **writer_options)
+    except Exception:
+        logging.error("tccli: export_file - export failed for file: %s, trace follows" % file)
+        logging.error(traceback.format_exc())
+        return (file, False, time.perf_counter() - start, None, None)
+
+    if options.verbose is not False:
+        logging.info("...Done!")
+    return (file, True, time.perf_counter() - start, report.as_dict(), paks[0] if paks else None)
+
+def file_stat(path):
+    """Return the identity and modification time of the file at path, which change when it is written or replaced,
+    or None if there is no file"""
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def make_paks(options, pak_path, results):
+    """Compile the .pak files deferred by export_file for each of results into pak_path, using as few runs of makeobj
+    as possible. Returns results (as returned by export_file) updated with the success and time taken by makeobj,
+    makeobj's output is logged together and added to each report"""
+    files = [r[0] for r in results]
+    start = time.perf_counter()
+    # Runs alongside other exports, so the .pak file mustn't be recorded in the active report (that of the project
+    # being exported), instead whether it was written is found from the file and added to the reports of results
+    before = file_stat(pak_path)
+    try:
+        success, output = tc.pak_files(pak_path, [(pak[0], pak[2], pak[3]) for file, s, seconds, report, pak in results],
+                                       options.makeobj_timeout, record=False)
+    except Exception:
+        logging.error("tccli: make_paks - makeobj failed for files: %s, trace follows" % ", ".join(files))
+        logging.error(traceback.format_exc())
+        success, output = False, traceback.format_exc()
+    wall = time.perf_counter() - start
+
+    # Output of several makeobjs running at once is kept apart by logging each in one go
+    logging.info("tccli: make_paks - makeobj output for files: %s\n%s" % (", ".join(files), output))
+    size = 0
+    if os.path.isfile(pak_path):
+        size = os.path.getsize(pak_path)
+    after = file_stat(pak_path)
+    updated = []
+    for file, export_success, seconds, report, pak in results:
+        # Projects compiled together share makeobj's time and output
+        stage = report["stages"]["makeobj"]
+        stage["wall"] += wall / len(results)
+        stage["count"] += 1
+        stage["bytes"] += size // len(results)
+        report["makeobj_output"] = output
+        if after is not None:
+            report["files"]["skipped" if after == before else "written"].append(pak_path)
+        updated.append((file, success, seconds + wall / len(results), report, None))
+    return updated
+
+def pak_group(group, pak_path):
+    """Return the path of the .pak file a project exported to pak_path is compiled into, for grouping by group
+    "project" and "pakfile" use the project's own .pak path, so projects sharing it are compiled together,
+    "directory" compiles every project in a directory into a .pak file named after the directory"""
+    if group == "directory":
+        directory = os.path.dirname(pak_path)
+        return os.path.join(directory, "%s.pak" % os.path.basename(directory))
+    else:
+        return pak_path
+
+def pipeline(options, exports, makeobj_pool):
+    """Start makeobj in makeobj_pool for each result of export_file in exports as soon as it is available,
+    so that the next project is exported while the last is compiled. Returns the list of final results
+    If .pak files are grouped (see pak_group) makeobj is started for each group once all projects are exported"""
+    group = options.makeobj_group or config.makeobj_group
+    results = []
+    # Pairs of (indexes into results, future of the results of make_paks for them)
+    pending = []
+    groups = OrderedDict()
+    for result in exports:
+        results.append(result)
+        if result[4] is None:
+            continue
+        if group == "project":
+            pending.append(([len(results) - 1], makeobj_pool.submit(make_paks, options, result[4][1], [result])))
+        else:
+            groups.setdefault(pak_group(group, result[4][1]), []).append(len(results) - 1)
+    for pak_path, indexes in groups.items():
+        pending.append((indexes, makeobj_pool.submit(make_paks, options, pak_path, [results[i] for i in indexes])))
+
+    for indexes, future in pending:
+        for i, result in zip(indexes, future.result()):
+            results[i] = result
+    return results
+
+def write_reports(path, results):
+    """Write the export reports of every file in results (as returned by export_file) to path as JSON"""
+    logging.info("tccli: write_reports - Writing export reports to: %s" % path)
+    reports = [{"file": file, "success": success, "seconds": seconds, "report": report} for file, success, seconds, report, pak in results]
+    f = open(path, "w")
+    json.dump(reports, f, indent=4)
+    f.close()
+
+def run(options, args):
+    """Export every project specified on the command line, returns True if all exports succeeded"""
+    logging.info("tccli: run - Init - Exporting without GUI")
+    start = time.perf_counter()
+
+    if options.verbose is True:
+        logging.info("options: %s" % str(options))
+        logging.info("args: %s" % str(args))
+    # Another good option would be to support "stub" datfiles
+    # produced as part of a pakset, which would have some kind of
+    # marker to allow inserting the image array matrix in a particular location
+
+    # Check through all args for directories, and expand these to list
+    # all contained .tcp files for processing
+    files = expand_paths(args)
+    jobs = max(1, options.jobs or 1)
+    logging.info("tccli: run - Exporting %s files, %s at a time" % (len(files), jobs))
+
+    # Projects are cut and written by the first stage, then passed to a second stage running
+    # up to makeobj_jobs makeobj processes at once, while the first stage moves on to the next project
+    makeobj_jobs = max(1, options.makeobj_jobs or 1)
+    with concurrent.futures.ThreadPoolExecutor(makeobj_jobs) as makeobj_pool:
+        if jobs == 1 or len(files) < 2:
+            results = pipeline(options, (export_file(options, file, True) for file in files), makeobj_pool)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(min(jobs, len(files))) as pool:
+                results = pipeline(options, pool.map(export_file, [options] * len(files), files, [True] * len(files)), makeobj_pool)
+
+    # Trimmed once for the whole run, rather than by every project (see export_file)
+    if options.cache_dir is not None:
+        tccache.tiles.directory = os.path.abspath(options.cache_dir)
+    tccache.tiles.trim()
+
+    if options.report is not None:
+        write_reports(options.report, results)
+
+    successes = [r for r in results if r[1]]
+    summary = "Exported %s of %s projects (%s failed) in %.2fs" % (len(successes), len(results), len(results) - len(successes), time.perf_counter() - start)
+    # Files shared by several projects (e.g. a grouped .pak file) are counted once
+    written = set([path for file, success, seconds, report, pak in results if report is not None for path in report["files"]["written"]])
+    skipped = set([path for file, success, seconds, report, pak in results if report is not None for path in report["files"]["skipped"]])
+    if written or skipped:
+        summary += ", %s files written, %s unchanged" % (len(written), len(skipped - written))
+    logging.info("tccli: run - %s" % summary)
+    if options.verbose is not False:
+        for file, success, seconds, report, pak in results:
+            print("%-6s %8.2fs  %s" % ("OK" if success else "FAILED", seconds, file))
+        print(summary)
+
+    return len(successes) == len(results)
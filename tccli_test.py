@@ -0,0 +1,238 @@
+#!/usr/bin/python
+
+"""Unit test for tccli.py"""
+
+import tccli
+import unittest
+import json, os, shutil, sys, tempfile, time
+from unittest import mock
+
+import config, tccache
+import tc_test
+
+import project
+from tcp import tcp_writer
+
+
+class expand_paths(unittest.TestCase):
+    """Test expansion of directories into the .tcp files they contain"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for path in ["b.tcp", "a.tcp", "notes.txt", os.path.join("sub", "c.TCP"), os.path.join("sub", "deeper", "d.tcp")]:
+            path = os.path.join(self.directory, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recursive(self):
+        expected = [os.path.join(self.directory, path) for path in ["a.tcp", "b.tcp", os.path.join("sub", "c.TCP"), os.path.join("sub", "deeper", "d.tcp")]]
+        self.assertEqual(tccli.expand_paths([self.directory]), expected)
+
+    def test_files_unchanged(self):
+        self.assertEqual(tccli.expand_paths(["missing.tcp", "notes.txt"]), ["missing.tcp", "notes.txt"])
+
+
+class Options(object):
+    """Command line options as produced by main's option parser, with no overrides set"""
+    png_directory = png_filename = None
+    dat_directory = dat_filename = None
+    pak_directory = pak_filename = None
+    pak_output = False
+    dat_output = True
+    verbose = False
+    jobs = 1
+    dedup = None
+    elide = None
+    layout = None
+    max_width = None
+    max_pixels = None
+    makeobj_jobs = 1
+    makeobj_timeout = None
+    makeobj_group = None
+    cache_dir = None
+    report = None
+
+
+class run(unittest.TestCase):
+    """Test exporting of several projects"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Cut images aren't kept between tests, unless a test sets a cache directory
+        self.tiles = mock.patch.object(tccache, "tiles", tccache.TileCache(None, 1 << 30))
+        self.tiles.start()
+        for name in ["one", "two"]:
+            proj = project.Project(tccli.CLIApp())
+            proj.save_location(os.path.join(self.directory, name, "%s.tcp" % name))
+            proj.set_all_images(os.path.abspath("test.png"))
+            tcp_writer(proj.save_location(), "json").write(proj)
+        f = open(os.path.join(self.directory, "broken.tcp"), "w")
+        f.write("not a project")
+        f.close()
+
+    def tearDown(self):
+        self.tiles.stop()
+        shutil.rmtree(self.directory)
+
+    def test_summary(self):
+        options = Options()
+        self.assertFalse(tccli.run(options, [self.directory]))
+        for name in ["one", "two"]:
+            self.assertTrue(os.path.isfile(os.path.join(self.directory, name, "output.png")))
+
+    def test_overrides(self):
+        options = Options()
+        options.png_filename = "override.png"
+        file, success, seconds, report, pak = tccli.export_file(options, os.path.join(self.directory, "one", "one.tcp"))
+        self.assertTrue(success)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "one", "override.png")))
+        file, success, seconds, report, pak = tccli.export_file(options, os.path.join(self.directory, "broken.tcp"))
+        self.assertFalse(success)
+        self.assertEqual(report, None)
+
+    def test_report(self):
+        options = Options()
+        options.report = os.path.join(self.directory, "report.json")
+        tccli.run(options, [self.directory])
+        f = open(options.report)
+        reports = json.load(f)
+        f.close()
+        self.assertEqual([(os.path.basename(r["file"]), r["success"]) for r in reports], [("broken.tcp", False), ("one.tcp", True), ("two.tcp", True)])
+        stages = reports[1]["report"]["stages"]
+        self.assertEqual(list(stages.keys()), ["load", "mask", "cut", "composite", "encode", "dat", "makeobj"])
+        # Only the one view the project outputs is cut
+        self.assertEqual(stages["cut"]["count"], 1)
+        self.assertEqual(stages["dat"]["count"], 1)
+        self.assertEqual(stages["encode"]["bytes"], os.path.getsize(os.path.join(self.directory, "one", "output.png")))
+        self.assertEqual(stages["makeobj"]["count"], 0)
+        self.assertEqual(reports[1]["report"]["files"]["skipped"], [])
+
+        # Exporting again leaves every output file untouched
+        tccli.run(options, [self.directory])
+        f = open(options.report)
+        reports = json.load(f)
+        f.close()
+        self.assertEqual(reports[1]["report"]["files"]["written"], [])
+        self.assertEqual(len(reports[1]["report"]["files"]["skipped"]), 2)
+
+    def test_cache_trimmed_once(self):
+        options = Options()
+        options.cache_dir = os.path.join(self.directory, "cache")
+        with mock.patch.object(tccache.tiles, "trim") as trim:
+            tccli.run(options, [self.directory])
+        self.assertEqual(trim.call_count, 1)
+
+    def test_cache_dir(self):
+        options = Options()
+        options.cache_dir = os.path.join(self.directory, "cache")
+        options.report = os.path.join(self.directory, "report.json")
+        for cut in [1, 0]:
+            # Images cut by the first run are read from the cache by the second
+            tccli.run(options, [os.path.join(self.directory, "one")])
+            f = open(options.report)
+            reports = json.load(f)
+            f.close()
+            self.assertEqual(reports[0]["report"]["stages"]["cut"]["count"], cut)
+        self.assertEqual(len([name for root, dirs, names in os.walk(options.cache_dir) for name in names]), 1)
+
+    @unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+    def test_pak(self):
+        makeobj = tc_test.write_fake_makeobj(self.directory)
+        options = Options()
+        options.pak_output = True
+        options.dat_output = False
+        options.makeobj_jobs = 2
+        options.pak_filename = "output.pak"
+        options.report = os.path.join(self.directory, "report.json")
+        with mock.patch.dict(config.Config.config, {"path_to_makeobj": makeobj}):
+            tccli.run(options, [os.path.join(self.directory, name) for name in ["one", "two"]])
+        f = open(options.report)
+        reports = json.load(f)
+        f.close()
+        for name, r in zip(["one", "two"], reports):
+            self.assertTrue(r["success"])
+            self.assertEqual(r["report"]["stages"]["makeobj"]["count"], 1)
+            self.assertEqual(r["report"]["stages"]["makeobj"]["bytes"], 3)
+            self.assertIn("warning", r["report"]["makeobj_output"])
+            # Temporary .dat file is removed once makeobj is done with it
+            self.assertEqual(sorted(os.listdir(os.path.join(self.directory, name))), sorted(["%s.tcp" % name, "output.pak", "output.png"]))
+
+    @unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+    def test_pak_files(self):
+        # .pak files compiled while the next project is exported are only in their own project's report
+        proj = project.Project(tccli.CLIApp())
+        proj.save_location(os.path.join(self.directory, "three", "three.tcp"))
+        proj.set_all_images(os.path.abspath("test.png"))
+        tcp_writer(proj.save_location(), "json").write(proj)
+        makeobj = tc_test.write_fake_makeobj(self.directory)
+        options = Options()
+        options.pak_output = True
+        options.dat_output = False
+        options.makeobj_jobs = 2
+        options.pak_filename = "output.pak"
+        options.report = os.path.join(self.directory, "report.json")
+        names = ["one", "two", "three"]
+        export_writer = tccli.tcarray.export_writer
+
+        def slow_export_writer(*args, **kwargs):
+            # Long enough for makeobj to finish compiling the last project while this one is exported
+            result = export_writer(*args, **kwargs)
+            time.sleep(0.5)
+            return result
+
+        with mock.patch.dict(config.Config.config, {"path_to_makeobj": makeobj}):
+            with mock.patch.object(tccli.tcarray, "export_writer", slow_export_writer):
+                tccli.run(options, [os.path.join(self.directory, name) for name in names])
+        f = open(options.report)
+        reports = json.load(f)
+        f.close()
+        for name, r in zip(names, reports):
+            self.assertEqual(sorted(r["report"]["files"]["written"]),
+                             [os.path.join(self.directory, name, "output.pak"), os.path.join(self.directory, name, "output.png")])
+            self.assertEqual(r["report"]["files"]["skipped"], [])
+
+    @unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+    def test_pak_group(self):
+        makeobj = tc_test.write_fake_makeobj(self.directory)
+        options = Options()
+        options.pak_output = True
+        options.pak_directory = self.directory
+        options.pak_filename = "all.pak"
+        options.makeobj_group = "pakfile"
+        with mock.patch.dict(config.Config.config, {"path_to_makeobj": makeobj}):
+            self.assertTrue(tccli.run(options, [os.path.join(self.directory, name) for name in ["one", "two"]]))
+        # Both projects compiled into one pak file by one run of makeobj
+        self.assertEqual(open(os.path.join(self.directory, "all.pak")).read(), "pakpak")
+
+    @unittest.skipIf(sys.platform.startswith("win"), "fake makeobj is a script")
+    def test_pak_group_directory(self):
+        makeobj = tc_test.write_fake_makeobj(self.directory)
+        options = Options()
+        options.pak_output = True
+        options.makeobj_group = "directory"
+        options.report = os.path.join(self.directory, "report.json")
+        with mock.patch.dict(config.Config.config, {"path_to_makeobj": makeobj}):
+            tccli.run(options, [self.directory])
+        for name in ["one", "two"]:
+            self.assertEqual(open(os.path.join(self.directory, name, "%s.pak" % name)).read(), "pak")
+        f = open(options.report)
+        reports = json.load(f)
+        f.close()
+        self.assertEqual([r["success"] for r in reports], [False, True, True])
+
+    def test_pak_deferred(self):
+        options = Options()
+        options.pak_output = True
+        file, success, seconds, report, pak = tccli.export_file(options, os.path.join(self.directory, "one", "one.tcp"), True)
+        self.assertTrue(success)
+        self.assertEqual(pak[0], 64)
+        self.assertEqual(pak[1:], (os.path.join(self.directory, "one", ""), os.path.join(self.directory, "one", "output.dat"), False))
+        self.assertTrue(os.path.isfile(pak[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# coding: UTF-8
+#
+# TileCutter Output Files
+#
+# Output files are written to a temporary file alongside them, which replaces the output file
+# only if the contents have changed. Unchanged outputs keep their modification time, so they
+# don't trigger makeobj runs or rebuilds, and a failed export never leaves a partly written file
+
+import hashlib, logging, os, shutil, tempfile
+import tcstats
+
+def file_hash(path):
+    """Return a hash of the contents of the file at path"""
+    digest = hashlib.sha1()
+    f = open(path, "rb")
+    for block in iter(lambda: f.read(1048576), b""):
+        digest.update(block)
+    f.close()
+    return digest.hexdigest()
+
+def same_contents(path1, path2):
+    """Return True if the files at path1 and path2 have the same contents"""
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return False
+    return file_hash(path1) == file_hash(path2)
+
+def replace_if_changed(new_path, path, record=True):
+    """Move the file at new_path to path, unless the file at path has the same contents already,
+    in which case new_path is deleted and path left untouched. Returns True if path was written
+    The file is added to the active tcstats report, unless record is False (e.g. when called from another
+    thread than the export, which records the file itself)"""
+    if os.path.isfile(path) and same_contents(new_path, path):
+        logging.info("tcoutput: replace_if_changed - Output unchanged, not written: %s" % path)
+        os.remove(new_path)
+        written = False
+    else:
+        if os.path.isfile(path):
+            shutil.copymode(path, new_path)
+        else:
+            # Temporary files are only readable by their owner, new outputs should get the usual permissions
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(new_path, 0o666 & ~umask)
+        os.replace(new_path, path)
+        written = True
+    if record:
+        tcstats.output_file(path, written)
+    return written
+
+def temporary_path(path, suffix=".tmp"):
+    """Return the path of a new, empty temporary file in the same directory as path"""
+    handle, temp_path = tempfile.mkstemp(suffix=suffix, dir=os.path.split(path)[0] or None)
+    os.close(handle)
+    return temp_path
+
+class OutputFile(object):
+    """File object for writing the output file at path, opened with mode ("w" or "wb")
+    Written to a temporary file, which replaces path when closed if the contents differ (see replace_if_changed)"""
+
+    def __init__(self, path, mode="wb"):
+        self.path = path
+        self.temp_path = temporary_path(path)
+        self.f = open(self.temp_path, mode)
+        # Set on close, True if path was written
+        self.written = None
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        """Finish writing, path is only replaced now"""
+        self.f.close()
+        self.written = replace_if_changed(self.temp_path, self.path)
+
+    def discard(self):
+        """Stop writing, leaving path untouched"""
+        self.f.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.close()
+        else:
+            self.discard()
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+"""Unit test for tcoutput.py"""
+
+import tcoutput
+import unittest
+import os, shutil, tempfile
+
+import tcstats
+
+
+class OutputFile(unittest.TestCase):
+    """Test writing of output files, leaving unchanged files untouched"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "output.dat")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="wb"):
+        f = tcoutput.OutputFile(self.path, mode)
+        f.write(data)
+        f.close()
+        return f.written
+
+    def test_new(self):
+        self.assertTrue(self.write(b"data"))
+        self.assertEqual(open(self.path, "rb").read(), b"data")
+        self.assertEqual(os.listdir(self.directory), ["output.dat"])
+        # Same permissions as any other new file, not those of a private temporary file
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o666 & ~umask)
+
+    def test_unchanged(self):
+        self.write("text", "w")
+        os.utime(self.path, (1000000000, 1000000000))
+        with tcstats.recording(tcstats.Report()) as report:
+            self.assertFalse(self.write("text", "w"))
+        self.assertEqual(os.stat(self.path).st_mtime, 1000000000)
+        self.assertEqual(os.listdir(self.directory), ["output.dat"])
+        self.assertEqual(report.files, {"written": [], "skipped": [self.path]})
+
+    def test_changed(self):
+        self.write(b"data")
+        os.chmod(self.path, 0o600)
+        os.utime(self.path, (1000000000, 1000000000))
+        with tcstats.recording(tcstats.Report()) as report:
+            self.assertTrue(self.write(b"date"))
+        self.assertEqual(open(self.path, "rb").read(), b"date")
+        self.assertNotEqual(os.stat(self.path).st_mtime, 1000000000)
+        # Permissions of the file replaced are kept
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual(report.files, {"written": [self.path], "skipped": []})
+
+    def test_failed(self):
+        self.write(b"data")
+        try:
+            with tcoutput.OutputFile(self.path) as f:
+                f.write(b"partial")
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(open(self.path, "rb").read(), b"data")
+        self.assertEqual(os.listdir(self.directory), ["output.dat"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+# coding: UTF-8
+#
+# TileCutter PNG reading/writing
+#
+# Reads and writes PNG files as arrays of RGBA values without needing wx,
+# used by the array cutting engine
+
+import io, struct, zlib
+import numpy as np
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Number of samples per pixel for each PNG colour type
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# Adam7 interlacing passes as (x start, y start, x step, y step)
+ADAM7 = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+
+def read(path):
+    """Read a PNG file, returns an array of shape (height, width, 4) of 8bit RGBA values"""
+    f = open(path, "rb")
+    data = f.read()
+    f.close()
+    return decode(data)
+
+def decode(data):
+    """Decode PNG data, returns an array of shape (height, width, 4) of 8bit RGBA values"""
+    if data[:8] != SIGNATURE:
+        raise ValueError("Not a PNG file")
+
+    header = None
+    palette = None
+    trns = None
+    idat = []
+    pos = 8
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = np.frombuffer(chunk, np.uint8).reshape(-1, 3)
+        elif kind == b"tRNS":
+            trns = chunk
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+
+    if header is None:
+        raise ValueError("PNG file has no IHDR chunk")
+
+    width, height, depth, colour, compression, filtering, interlace = header
+    if colour not in CHANNELS or depth not in [1, 2, 4, 8, 16]:
+        raise ValueError("Unsupported PNG colour type %s at bit depth %s" % (colour, depth))
+    if colour == 3 and palette is None:
+        raise ValueError("Palette PNG file has no PLTE chunk")
+
+    raw = zlib.decompress(b"".join(idat))
+    channels = CHANNELS[colour]
+
+    if interlace:
+        samples = np.zeros((height, width, channels), np.uint16 if depth == 16 else np.uint8)
+        offset = 0
+        for x0, y0, dx, dy in ADAM7:
+            w = (width - x0 + dx - 1) // dx
+            h = (height - y0 + dy - 1) // dy
+            if w == 0 or h == 0:
+                continue
+            size = h * ((w * channels * depth + 7) // 8 + 1)
+            samples[y0::dy, x0::dx] = unpack(raw[offset:offset + size], w, h, channels, depth)
+            offset += size
+    else:
+        samples = unpack(raw, width, height, channels, depth)
+
+    return to_rgba(samples, colour, depth, palette, trns)
+
+def unpack(raw, width, height, channels, depth):
+    """Unfilter one (sub)image of PNG data, returns an array of shape (height, width, channels)"""
+    stride = (width * channels * depth + 7) // 8
+    rows = unfilter(raw, height, stride, max(1, channels * depth // 8))
+
+    if depth == 8:
+        return rows.reshape(height, width, channels)
+    elif depth == 16:
+        rows = rows.reshape(height, width * channels, 2).astype(np.uint16)
+        return ((rows[:, :, 0] << 8) | rows[:, :, 1]).reshape(height, width, channels)
+    else:
+        # Sub-byte depths are only used by greyscale and palette images, which have one channel
+        bits = np.unpackbits(rows, axis=1).reshape(height, stride * 8 // depth, depth)
+        weights = 1 << np.arange(depth - 1, -1, -1, dtype=np.uint8)
+        values = (bits * weights).sum(axis=2, dtype=np.uint8)
+        return values[:, :width].reshape(height, width, 1)
+
+def unfilter(raw, height, stride, bpp):
+    """Undo per-row PNG filtering, returns an array of shape (height, stride) of bytes"""
+    rows = np.frombuffer(raw, np.uint8, height * (stride + 1)).reshape(height, stride + 1)
+    filters = rows[:, 0]
+    data = rows[:, 1:]
+
+    if filters.max() > 4:
+        raise ValueError("Invalid PNG filter type %s" % filters.max())
+
+    # Average and Paeth filters depend on the unfiltered pixel to the left, so need to be handled
+    # along diagonals, everything else can be done a row at a time
+    if (filters >= 3).any():
+        return unfilter_diagonals(filters, data, bpp)
+
+    output = np.empty((height, stride), np.uint8)
+    prior = np.zeros(stride, np.uint8)
+    for y in range(height):
+        if filters[y] == 0:
+            output[y] = data[y]
+        elif filters[y] == 1:
+            output[y] = data[y].reshape(-1, bpp).cumsum(axis=0, dtype=np.uint8).reshape(-1)
+        elif filters[y] == 2:
+            output[y] = data[y] + prior
+        prior = output[y]
+
+    return output
+
+def unfilter_diagonals(filters, data, bpp):
+    """Undo PNG filtering of any type, a diagonal of pixels at a time"""
+    height, stride = data.shape
+    width = stride // bpp
+    data = data.reshape(height, width, bpp).astype(np.int16)
+    filters = filters.astype(np.int16)
+
+    # Padded with a row above and a column to the left so every pixel has neighbours
+    output = np.zeros((height + 1, width + 1, bpp), np.int16)
+    for k in range(height + width - 1):
+        ys = np.arange(max(0, k - width + 1), min(height, k + 1))
+        xs = k - ys
+        a = output[ys + 1, xs]
+        b = output[ys, xs + 1]
+        c = output[ys, xs]
+        pa = np.abs(b - c)
+        pb = np.abs(a - c)
+        pc = np.abs(a + b - c - c)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        f = filters[ys][:, None]
+        predictor = np.select([f == 1, f == 2, f == 3, f == 4], [a, b, (a + b) >> 1, paeth], 0)
+        output[ys + 1, xs + 1] = (data[ys, xs] + predictor) & 0xFF
+
+    return output[1:, 1:].astype(np.uint8).reshape(height, stride)
+
+def to_rgba(samples, colour, depth, palette, trns):
+    """Convert decoded samples of any PNG colour type and depth into 8bit RGBA values"""
+    height, width = samples.shape[:2]
+    rgba = np.empty((height, width, 4), np.uint8)
+
+    if colour == 3:
+        index = samples[:, :, 0]
+        colours = np.zeros((256, 3), np.uint8)
+        colours[:len(palette)] = palette[:256]
+        alphas = np.full(256, 255, np.uint8)
+        if trns is not None:
+            alphas[:len(trns)] = np.frombuffer(trns[:256], np.uint8)
+        rgba[:, :, :3] = colours[index]
+        rgba[:, :, 3] = alphas[index]
+        return rgba
+
+    # Scale samples to 8 bits, 16bit values keep only their high byte
+    if depth == 16:
+        values = (samples >> 8).astype(np.uint8)
+    elif depth < 8:
+        values = samples * (255 // ((1 << depth) - 1))
+    else:
+        values = samples
+
+    if colour in [0, 4]:
+        rgba[:, :, :3] = values[:, :, :1]
+    else:
+        rgba[:, :, :3] = values[:, :, :3]
+
+    if colour in [4, 6]:
+        rgba[:, :, 3] = values[:, :, -1]
+    else:
+        rgba[:, :, 3] = 255
+        # A tRNS chunk gives a single colour which is fully transparent
+        if trns is not None and colour == 0:
+            rgba[samples[:, :, 0] == struct.unpack(">H", trns[:2])[0], 3] = 0
+        elif trns is not None and colour == 2:
+            key = np.array(struct.unpack(">HHH", trns[:6]))
+            rgba[(samples == key).all(axis=2), 3] = 0
+
+    return rgba
+
+def chunk(kind, data):
+    """Return a PNG chunk of the specified kind containing data"""
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+class Writer(object):
+    """Writes a PNG file a band of rows at a time, so the whole image never needs to be in memory
+    Output only depends on the pixels and compression level, no timestamps are included"""
+
+    # Size of each IDAT chunk written, a fixed size so output doesn't depend on how rows are passed in
+    chunk_size = 65536
+
+    def __init__(self, f, width, height, channels, compression=6):
+        """Write the PNG header to file object f, for an image of 8bit RGB (3 channels) or RGBA (4) values"""
+        self.f = f
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows = 0
+        self.prior = np.zeros(width * channels, np.uint8)
+        # All settings given, rather than zlib's defaults, so the same image is always encoded the same way
+        self.compressor = zlib.compressobj(compression, zlib.DEFLATED, 15, 8, zlib.Z_DEFAULT_STRATEGY)
+        self.pending = b""
+        colour = {3: 2, 4: 6}[channels]
+        self.f.write(SIGNATURE)
+        self.f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, colour, 0, 0, 0)))
+
+    def write(self, array):
+        """Write an array of shape (rows, width, channels) of 8bit values as the next rows of the image"""
+        height = array.shape[0]
+        if self.rows + height > self.height:
+            raise ValueError("Too many rows written to PNG file")
+        values = np.ascontiguousarray(array, np.uint8).reshape(height, self.width * self.channels)
+
+        # Every row uses the Up filter, storing the difference from the row above
+        rows = np.empty((height, self.width * self.channels + 1), np.uint8)
+        rows[:, 0] = 2
+        rows[0, 1:] = values[0] - self.prior
+        rows[1:, 1:] = values[1:] - values[:-1]
+        self.prior = values[-1].copy()
+        self.rows += height
+
+        self.pending += self.compressor.compress(rows.tobytes())
+        self.write_pending(self.chunk_size)
+
+    def write_pending(self, size):
+        """Write out compressed data in IDAT chunks of size bytes, keeping back any remainder"""
+        while len(self.pending) >= size and len(self.pending) > 0:
+            self.f.write(chunk(b"IDAT", self.pending[:size]))
+            self.pending = self.pending[size:]
+
+    def close(self):
+        """Finish the PNG file, all rows must have been written"""
+        if self.rows != self.height:
+            raise ValueError("PNG file closed with %s of %s rows written" % (self.rows, self.height))
+        self.pending += self.compressor.flush()
+        self.write_pending(self.chunk_size)
+        self.write_pending(len(self.pending))
+        self.f.write(chunk(b"IEND", b""))
+
+def encode(array, compression=6):
+    """Encode an array of shape (height, width, 3 or 4) of 8bit RGB or RGBA values as PNG data
+    Output only depends on the pixels and compression level, no timestamps are included"""
+    height, width, channels = array.shape
+    f = io.BytesIO()
+    writer = Writer(f, width, height, channels, compression)
+    writer.write(array)
+    writer.close()
+    return f.getvalue()
+
+def write(path, array, compression=6):
+    """Write an array of shape (height, width, 3 or 4) of 8bit RGB or RGBA values to a PNG file"""
+    f = open(path, "wb")
+    f.write(encode(array, compression))
+    f.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+
+"""Unit test for tcpng.py"""
+
+import tcpng
+import unittest
+import struct, zlib
+import numpy as np
+
+
+def raw_png(width, height, depth, colour, rows, extra=[], interlace=0):
+    """Build a PNG file from already filtered rows of data"""
+    return b"".join([
+        tcpng.SIGNATURE,
+        tcpng.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, depth, colour, 0, 0, interlace)),
+    ] + [tcpng.chunk(kind, data) for kind, data in extra] + [
+        tcpng.chunk(b"IDAT", zlib.compress(rows)),
+        tcpng.chunk(b"IEND", b""),
+    ])
+
+
+class RoundTrip(unittest.TestCase):
+    """Arrays written by encode should decode to the same values"""
+
+    def test_rgba(self):
+        array = np.random.RandomState(1).randint(0, 256, (13, 7, 4)).astype(np.uint8)
+        self.assertTrue((tcpng.decode(tcpng.encode(array)) == array).all())
+
+    def test_rgb(self):
+        array = np.random.RandomState(2).randint(0, 256, (5, 9, 3)).astype(np.uint8)
+        decoded = tcpng.decode(tcpng.encode(array))
+        self.assertTrue((decoded[:, :, :3] == array).all())
+        self.assertTrue((decoded[:, :, 3] == 255).all())
+
+    def test_deterministic(self):
+        array = np.random.RandomState(3).randint(0, 256, (8, 8, 4)).astype(np.uint8)
+        self.assertEqual(tcpng.encode(array), tcpng.encode(array.copy()))
+
+
+class StreamingWriter(unittest.TestCase):
+    """Images written a band at a time should be the same as those encoded at once"""
+
+    def test_bands(self):
+        import io
+        array = np.random.RandomState(4).randint(0, 256, (300, 200, 4)).astype(np.uint8)
+        f = io.BytesIO()
+        writer = tcpng.Writer(f, 200, 300, 4)
+        for y in range(0, 300, 64):
+            writer.write(array[y:y + 64])
+        writer.close()
+        # Large enough to be split across several IDAT chunks
+        self.assertTrue(f.getvalue().count(b"IDAT") > 1)
+        self.assertEqual(f.getvalue(), tcpng.encode(array))
+        self.assertTrue((tcpng.decode(f.getvalue()) == array).all())
+
+    def test_row_count(self):
+        import io
+        writer = tcpng.Writer(io.BytesIO(), 4, 4, 3)
+        writer.write(np.zeros((3, 4, 3), np.uint8))
+        self.assertRaises(ValueError, writer.close)
+        self.assertRaises(ValueError, writer.write, np.zeros((2, 4, 3), np.uint8))
+
+
+class Decode(unittest.TestCase):
+    """Decoding of colour types, bit depths and filters not produced by encode"""
+
+    def test_filters(self):
+        # Same 2x2 RGB image using Sub, Average and Paeth filters
+        pixels = np.array([[[10, 20, 30], [40, 50, 60]], [[70, 80, 90], [100, 110, 120]]], np.uint8)
+        rows = (b"\x01" + bytes([10, 20, 30, 30, 30, 30]) +
+                b"\x03" + bytes([65, 70, 75, 45, 45, 45]))
+        decoded = tcpng.decode(raw_png(2, 2, 8, 2, rows))
+        self.assertTrue((decoded[:, :, :3] == pixels).all())
+        rows = (b"\x00" + bytes([10, 20, 30, 40, 50, 60]) +
+                b"\x04" + bytes([60, 60, 60, 30, 30, 30]))
+        decoded = tcpng.decode(raw_png(2, 2, 8, 2, rows))
+        self.assertTrue((decoded[:, :, :3] == pixels).all())
+
+    def test_grey_16bit(self):
+        rows = b"\x00" + struct.pack(">HH", 0x1234, 0xFF00)
+        decoded = tcpng.decode(raw_png(2, 1, 16, 0, rows))
+        self.assertEqual(decoded[0, 0].tolist(), [0x12, 0x12, 0x12, 255])
+        self.assertEqual(decoded[0, 1].tolist(), [0xFF, 0xFF, 0xFF, 255])
+
+    def test_palette_1bit(self):
+        extra = [(b"PLTE", bytes([255, 0, 0, 0, 0, 255])), (b"tRNS", bytes([0]))]
+        decoded = tcpng.decode(raw_png(3, 1, 1, 3, b"\x00" + bytes([0b01000000]), extra))
+        self.assertEqual(decoded[0].tolist(), [[255, 0, 0, 0], [0, 0, 255, 255], [255, 0, 0, 0]])
+
+    def test_interlaced(self):
+        # 2x2 greyscale image, Adam7 passes 1, 6 and 7 hold pixels (0,0), (1,0) and row 1
+        rows = b"\x00\x01" + b"\x00\x02" + b"\x00\x03\x04"
+        decoded = tcpng.decode(raw_png(2, 2, 8, 0, rows, interlace=1))
+        self.assertEqual(decoded[:, :, 0].tolist(), [[1, 2], [3, 4]])
+
+    def test_not_png(self):
+        self.assertRaises(ValueError, tcpng.decode, b"GIF89a")
+
+    def test_repo_image(self):
+        decoded = tcpng.read("test.png")
+        self.assertEqual(decoded.ndim, 3)
+        self.assertEqual(decoded.shape[2], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# coding: UTF-8
+#
+# TileCutter Export Statistics
+#
+# Records the time taken, bytes produced and number of items processed by each stage of an export
+
+import json, logging, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Stages of an export, in the order they first happen
+stage_names = ["load", "mask", "cut", "composite", "encode", "dat", "makeobj"]
+
+class Report(object):
+    """Totals for each stage of an export
+    Times are summed over every run of a stage, so a stage running in several threads can take longer than the export.
+    Image load and mask build happen while cutting, so their times are also included in the time of the cut stage"""
+
+    def __init__(self):
+        self.stages = OrderedDict([(name, {"wall": 0.0, "cpu": 0.0, "bytes": 0, "count": 0}) for name in stage_names])
+        # Totals for the whole export, set by recording
+        self.wall = 0.0
+        self.cpu = 0.0
+        # Output files written, and those left untouched because their contents were unchanged
+        self.files = {"written": [], "skipped": []}
+        self.lock = threading.Lock()
+
+    def add(self, name, wall=0.0, cpu=0.0, bytes=0, count=0):
+        """Add one run of stage name to the totals"""
+        with self.lock:
+            stage = self.stages[name]
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            stage["bytes"] += bytes
+            stage["count"] += count
+
+    def add_file(self, path, written):
+        """Add an output file, written or skipped"""
+        with self.lock:
+            self.files["written" if written else "skipped"].append(path)
+
+    def as_dict(self):
+        """Return the report as a dict, ready for JSON output"""
+        with self.lock:
+            return {
+                "wall": self.wall,
+                "cpu": self.cpu,
+                "stages": OrderedDict([(name, dict(stage)) for name, stage in self.stages.items()]),
+                "files": dict([(k, list(v)) for k, v in self.files.items()]),
+            }
+
+    def summary(self):
+        """Return a one line summary of the report, e.g. for a status bar"""
+        stages = ["%s %.2fs" % (name, stage["wall"]) for name, stage in self.stages.items() if stage["wall"] > 0]
+        text = "%.2fs (%s)" % (self.wall, ", ".join(stages))
+        if self.files["written"] or self.files["skipped"]:
+            text += ", %s files written, %s unchanged" % (len(self.files["written"]), len(self.files["skipped"]))
+        return text
+
+    def write(self, path):
+        """Write the report to path as JSON"""
+        logging.info("tcstats: write - Writing export report to: %s" % path)
+        f = open(path, "w")
+        json.dump(self.as_dict(), f, indent=4)
+        f.close()
+
+class Measure(object):
+    """Bytes and items produced by one run of a stage, set by the code being measured"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.count = 0
+
+# Report stages are currently added to, None when no export is being recorded
+active = None
+
+@contextmanager
+def recording(report):
+    """Add the stages run within this context to report, and set its total times"""
+    global active
+    previous = active
+    active = report
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield report
+    finally:
+        report.wall += time.perf_counter() - wall
+        report.cpu += time.process_time() - cpu
+        active = previous
+
+@contextmanager
+def stage(name):
+    """Time one run of stage name, adding it to the active report if there is one
+    Yields a Measure, whose bytes and count should be set to the output of the stage"""
+    measure = Measure()
+    wall = time.perf_counter()
+    # Stages can run in several threads at once, so only count CPU time of the thread running this one
+    # (not including any worker threads or processes it waits for)
+    cpu = time.thread_time()
+    try:
+        yield measure
+    finally:
+        report = active
+        if report is not None:
+            report.add(name, time.perf_counter() - wall, time.thread_time() - cpu, measure.bytes, measure.count)
+
+def output_file(path, written):
+    """Record an output file in the active report if there is one, written is False if it was left unchanged"""
+    report = active
+    if report is not None:
+        report.add_file(path, written)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+"""Unit test for tcstats.py"""
+
+import tcstats
+import unittest
+import threading
+
+
+class Report(unittest.TestCase):
+    """Test recording of export stages"""
+
+    def test_recording(self):
+        with tcstats.recording(tcstats.Report()) as report:
+            for i in range(3):
+                with tcstats.stage("encode") as measure:
+                    measure.bytes = 10
+                    measure.count = 1
+        stages = report.as_dict()["stages"]
+        self.assertEqual(stages["encode"]["bytes"], 30)
+        self.assertEqual(stages["encode"]["count"], 3)
+        self.assertGreater(stages["encode"]["wall"], 0)
+        self.assertEqual(stages["cut"], {"wall": 0.0, "cpu": 0.0, "bytes": 0, "count": 0})
+        self.assertGreaterEqual(report.wall, stages["encode"]["wall"])
+
+    def test_not_recording(self):
+        # Stages run outside of a recording aren't added to any report
+        report = tcstats.Report()
+        with tcstats.stage("cut") as measure:
+            measure.count = 1
+        self.assertEqual(report.stages["cut"]["count"], 0)
+        self.assertEqual(tcstats.active, None)
+
+    def test_nested(self):
+        with tcstats.recording(tcstats.Report()) as outer:
+            with tcstats.recording(tcstats.Report()) as inner:
+                with tcstats.stage("dat") as measure:
+                    measure.count = 1
+            with tcstats.stage("dat") as measure:
+                measure.count = 1
+        self.assertEqual(inner.stages["dat"]["count"], 1)
+        self.assertEqual(outer.stages["dat"]["count"], 1)
+
+    def test_threads(self):
+        def load():
+            for i in range(100):
+                with tcstats.stage("load") as measure:
+                    measure.count = 1
+        with tcstats.recording(tcstats.Report()) as report:
+            threads = [threading.Thread(target=load) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(report.stages["load"]["count"], 400)
+
+    def test_summary(self):
+        report = tcstats.Report()
+        report.wall = 1.5
+        report.add("cut", wall=1.0)
+        report.add("encode", wall=0.25)
+        self.assertEqual(report.summary(), "1.50s (cut 1.00s, encode 0.25s)")
+        report.add_file("output.png", True)
+        report.add_file("output.dat", False)
+        self.assertEqual(report.summary(), "1.50s (cut 1.00s, encode 0.25s), 1 files written, 1 unchanged")
+
+
+if __name__ == "__main__":
+    unittest.main()
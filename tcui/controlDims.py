@@ -16,6 +16,7 @@ class controlDims(wx.Panel):
 
         wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
         self.app = app
+        self.app.subscribe(["dims.paksize", "dims.x", "dims.y", "dims.z"], self.update)
 
         # Setup sizers
         self.sizer = wx.BoxSizer(wx.VERTICAL)
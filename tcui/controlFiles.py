@@ -17,6 +17,7 @@ class controlFiles(wx.Panel):
         wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
         self.ftbox = tcui.filePicker(parent)
         self.app = app
+        self.app.subscribe(["files"], self.update)
         self.parent = parent
 
         self.sizer = wx.FlexGridSizer(0, 5, 3, 0)
@@ -15,6 +15,7 @@ class controlImage(wx.Panel):
 
         wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
         self.app = app
+        self.app.subscribe(["transparency", "dims.frontimage"], self.update)
 
         # Setup sizers
         self.sizer = wx.BoxSizer(wx.VERTICAL)
@@ -87,4 +87,4 @@ class controlImageFile(wx.Panel):
     def OnReloadImage(self, e):
         """When reload image button clicked"""
         logging.info("tcui.controlImageFile: OnReloadImage")
-        self.app.activeproject.reload_active_image()
+        self.app.activeproject.reload_active_image(invalidate=True)
@@ -18,6 +18,7 @@ class controlSeason(wx.Panel):
 
         wx.Panel.__init__(self, parent=parent, id=wx.ID_ANY)
         self.app = app
+        self.app.subscribe(["dims.seasons"], self.update)
 
         # Setup sizers
         self.sizer = wx.BoxSizer(wx.VERTICAL)
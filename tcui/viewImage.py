@@ -20,6 +20,9 @@ class viewImage(wx.Panel):
         self.bgcolor = bgcolor
         self.app = app
         self.parent = parent
+        # The active image, its path and offset, and the tiles drawn over it
+        self.app.subscribe(["activeimage", "images[*][*][*][*].path", "images[*][*][*][*].offset", "dims.paksize",
+                            "dims.x", "dims.y", "dims.z", "transparency", "files.save_location"], self.update)
         self.scrolledwindow = wx.ScrolledWindow(self, wx.ID_ANY, style=wx.SUNKEN_BORDER)
 
         # Required for wx.AutoBufferedPaintDC to work